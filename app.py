@@ -1,22 +1,27 @@
 #!/usr/bin/env python3
 """
 CNS Project: Secure Image & PDF Transfer
-Using Huffman Compression, AES, ElGamal, QR Code (URL-based), PIN, and Database
+Using Huffman Compression, AES, ElGamal/X25519, QR Code (URL-based), PIN, and Database
 """
 
 import os
+import ssl
+import time
 import uuid
+import string
+import secrets
+import hmac
 import hashlib
 import sqlite3
 import base64
 from datetime import datetime, timedelta
 from flask import Flask, request, jsonify, render_template, redirect, url_for, send_file
-import qrcode
-from io import BytesIO
+import segno
+from cryptography.exceptions import InvalidTag
 import logging
 
 # Import our custom modules
-from crypto_utils import HuffmanCompression, AESCrypto, ElGamalCrypto
+from crypto_utils import HuffmanCompression, AESCrypto, ElGamalCrypto, X25519Crypto
 from database import DatabaseManager
 
 app = Flask(__name__)
@@ -26,9 +31,18 @@ app.secret_key = os.urandom(24)
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# hashlib is backed by OpenSSL, which uses SHA-NI/AVX2 transforms when the CPU has them
+logger.info("OpenSSL: %s", ssl.OPENSSL_VERSION)
+logger.info("hashlib algorithms: %s", ', '.join(sorted(hashlib.algorithms_available)))
+
 # Initialize database
 db_manager = DatabaseManager()
 
+# Crypto helpers hold no per-call state, so one instance serves every request
+aes_crypto = AESCrypto()
+elgamal = ElGamalCrypto()
+x25519 = X25519Crypto()
+
 @app.route('/')
 def home():
     """Home page with send/receive options"""
@@ -47,6 +61,7 @@ def session_send_page():
 @app.route('/upload', methods=['POST'])
 def upload_file():
     """Handle file upload and encryption process"""
+    start_time = time.perf_counter()
     try:
         # Check if file was uploaded
         if 'file' not in request.files:
@@ -57,30 +72,33 @@ def upload_file():
             return jsonify({'error': 'No file selected'}), 400
         
         # Validate file type
-        allowed_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.pdf'}
-        file_ext = os.path.splitext(file.filename)[1].lower()
-        if file_ext not in allowed_extensions:
+        if file_extension(file.filename) not in MIME_TYPES:
             return jsonify({'error': 'Only images (JPG, PNG, GIF) and PDF files are allowed'}), 400
         
-        # Read file data
-        file_data = file.read()
-        original_size = len(file_data)
-        logger.info(f"File uploaded: {file.filename} ({original_size} bytes)")
+        # Measure the upload; the data itself is streamed through compression + encryption
+        stream = file.stream
+        stream.seek(0, os.SEEK_END)
+        original_size = stream.tell()
+        stream.seek(0)
+        logger.debug("File uploaded: %s (%d bytes)", file.filename, original_size)
         
         # Get expiry time and intended receiver name from request
         expiry_minutes = int(request.form.get('expiry', 5))
         expiry_time = datetime.now() + timedelta(minutes=expiry_minutes)
         intended_receiver_name = request.form.get('intended_receiver_name', '').strip()
         
-        # Step 1: Generate ElGamal key pair
-        elgamal = ElGamalCrypto()
-        public_key, private_key = elgamal.generate_keypair()
-        logger.info("ElGamal key pair generated")
+        # Step 1: Generate X25519 key pair
+        public_key, private_key = x25519.generate_keypair()
+        logger.debug("X25519 key pair generated")
+        
+        # Step 2: Generate random AES key
+        aes_key = aes_crypto.generate_key()
+        logger.debug("AES key generated")
         
-        # Step 2: Compress file using Huffman coding
+        # Step 3: Compress file using Huffman coding and encrypt it using AES, chunk by chunk
         huffman = HuffmanCompression()
-        compressed_data = huffman.compress(file_data)
-        compressed_size = len(compressed_data)
+        encrypted_file = aes_crypto.encrypt_stream(huffman.compress_stream(stream), aes_key)
+        compressed_size = len(encrypted_file) - aes_crypto.nonce_size - aes_crypto.tag_size
         
         # Calculate compression ratio
         if original_size > 0:
@@ -88,58 +106,43 @@ def upload_file():
         else:
             compression_ratio = 0.0
         
-        logger.info(f"File compressed using Huffman")
-        logger.info(f"Original size: {original_size} bytes")
-        logger.info(f"Compressed size: {compressed_size} bytes") 
-        logger.info(f"Compression ratio: {compression_ratio:.2f}%")
+        logger.debug("File compressed using Huffman and encrypted using AES: %d -> %d bytes",
+                     original_size, compressed_size)
         
-        # Step 3: Generate random AES key
-        aes_crypto = AESCrypto()
-        aes_key = aes_crypto.generate_key()
-        logger.info("AES key generated")
+        # Step 4: Wrap AES key for the X25519 public key
+        encrypted_aes_key = x25519.encrypt(aes_key, public_key)
+        logger.debug("AES key encrypted using X25519")
         
-        # Step 4: Encrypt compressed file using AES
-        encrypted_file = aes_crypto.encrypt(compressed_data, aes_key)
-        logger.info("File encrypted using AES")
-        
-        # Step 5: Encrypt AES key using ElGamal public key
-        encrypted_aes_key = elgamal.encrypt(aes_key, public_key)
-        logger.info("AES key encrypted using ElGamal")
-        
-        # Step 6: Generate SHA-256 hash of encrypted file
-        hash_value = hashlib.sha256(encrypted_file).hexdigest()
-        logger.info("SHA-256 hash generated")
-        
-        # Step 7: Generate alphanumeric PIN
+        # Step 5: Generate alphanumeric PIN
         pin = generate_pin()
-        hashed_pin = hashlib.sha256(pin.encode()).hexdigest()
-        logger.info(f"PIN generated: {pin}")
+        hashed_pin = hashlib.sha256(pin.encode()).digest()
+        logger.debug("PIN generated")
         
-        # Step 8: Generate transaction ID
+        # Step 6: Generate transaction ID
         transaction_id = str(uuid.uuid4())
         
-        # Step 9: Store in database
+        # Step 7: Store in database
         db_manager.store_transaction(
             transaction_id=transaction_id,
-            encrypted_file=base64.b64encode(encrypted_file).decode(),
-            encrypted_aes_key=base64.b64encode(encrypted_aes_key).decode(),
-            private_key=base64.b64encode(private_key).decode(),
-            hash_value=hash_value,
+            encrypted_file=encrypted_file,
+            encrypted_aes_key=encrypted_aes_key,
+            private_key=private_key,
             hashed_pin=hashed_pin,
             expiry_time=expiry_time,
             file_name=file.filename,
-            huffman_tree=base64.b64encode(huffman.get_tree()).decode(),
+            huffman_tree=huffman.get_tree(),
             original_size=original_size,
             compressed_size=compressed_size,
             compression_ratio=compression_ratio,
             intended_receiver_name=intended_receiver_name
         )
-        logger.info(f"Transaction stored with ID: {transaction_id}")
+        logger.debug("Transaction stored with ID: %s", transaction_id)
         
-        # Step 10: Generate QR code with URL
+        # Step 8: Generate QR code with URL
         qr_url = f"{request.url_root}receive?tid={transaction_id}"
         qr_code_data = generate_qr_code(qr_url)
-        logger.info("QR URL generated")
+        logger.info("Upload tid=%s size=%d ratio=%.1f%% elapsed=%.2fms", transaction_id, original_size,
+                    compression_ratio, (time.perf_counter() - start_time) * 1000)
         
         return jsonify({
             'success': True,
@@ -153,7 +156,7 @@ def upload_file():
         })
         
     except Exception as e:
-        logger.error(f"Upload error: {str(e)}")
+        logger.error("Upload error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/receive')
@@ -165,6 +168,7 @@ def receive_page():
 @app.route('/decrypt', methods=['POST'])
 def decrypt_file():
     """Handle file decryption process"""
+    start_time = time.perf_counter()
     try:
         transaction_id = request.json.get('transaction_id')
         pin = request.json.get('pin')
@@ -174,94 +178,75 @@ def decrypt_file():
         if not transaction_id or not pin:
             return jsonify({'error': 'Transaction ID and PIN are required'}), 400
         
-        # Get transaction from database
-        transaction = db_manager.get_transaction(transaction_id)
+        # Count this attempt up front (without the encrypted payload until the PIN checks out);
+        # the returned count is this request's own, so parallel guesses can't share one check
+        transaction = db_manager.claim_attempt(transaction_id)
         if not transaction:
             return jsonify({'error': 'Invalid transaction ID'}), 404
+        new_count = transaction['attempt_count']
         
         # Check if transaction is expired
-        if datetime.now() > datetime.fromisoformat(transaction['expiry_time']):
+        if time.time() > transaction['expiry_epoch']:
             db_manager.delete_transaction(transaction_id)
             logger.info("Expired link accessed")
             return jsonify({'error': 'Link has expired'}), 410
         
-        # Check PIN attempts
-        if transaction['attempt_count'] >= 3:
+        # Check PIN attempts (three are allowed, this one included)
+        if new_count > 3:
             db_manager.delete_transaction(transaction_id)
             logger.info("Locked access - too many attempts")
             return jsonify({'error': 'Access locked due to too many invalid attempts'}), 423
         
         # Verify intended receiver name (before PIN verification for security)
-        intended_receiver = transaction.get('intended_receiver_name', '').strip()
+        intended_receiver = (transaction['intended_receiver_name'] or '').strip()
         if intended_receiver and receiver_name.strip() != intended_receiver:
-            # Increment attempt count for name mismatch
-            db_manager.increment_attempts(transaction_id)
-            new_count = transaction['attempt_count'] + 1
-            logger.info(f"Receiver name mismatch: expected '{intended_receiver}', got '{receiver_name}' - attempt {new_count}/3")
+            # Name mismatch counts as the attempt already claimed
+            logger.info("Receiver name mismatch: expected '%s', got '%s' - attempt %d/3",
+                        intended_receiver, receiver_name, new_count)
             return jsonify({
                 'error': f'Receiver name does not match ({new_count}/3)',
                 'attempts_remaining': 3 - new_count
             }), 401
         
-        # Verify PIN
-        hashed_pin = hashlib.sha256(pin.encode()).hexdigest()
-        if hashed_pin != transaction['hashed_pin']:
-            # Increment attempt count
-            new_count = transaction['attempt_count'] + 1
-            db_manager.increment_attempts(transaction_id)
-            logger.info(f"Wrong PIN attempt {new_count}/3")
+        # Verify PIN (constant-time compare; rows created before the BLOB column hold the hex digest)
+        pin_digest = hashlib.sha256(pin.encode()).digest()
+        stored_pin = transaction['hashed_pin']
+        if isinstance(stored_pin, str):
+            pin_digest = pin_digest.hex()
+        if not hmac.compare_digest(pin_digest, stored_pin):
+            logger.info("Wrong PIN attempt %d/3", new_count)
             return jsonify({
                 'error': f'Invalid PIN ({new_count}/3)',
                 'attempts_remaining': 3 - new_count
             }), 401
         
-        logger.info("PIN verification successful")
-        
-        # Decrypt AES key using ElGamal private key
-        elgamal = ElGamalCrypto()
-        private_key = base64.b64decode(transaction['private_key'].encode())
-        encrypted_aes_key = base64.b64decode(transaction['encrypted_aes_key'].encode())
-        aes_key = elgamal.decrypt(encrypted_aes_key, private_key)
-        logger.info("AES key decrypted using ElGamal")
-        
-        # Decrypt file using AES
-        aes_crypto = AESCrypto()
-        encrypted_file = base64.b64decode(transaction['encrypted_file'].encode())
+        logger.debug("PIN verification successful")
+        transaction = db_manager.get_transaction(transaction_id)
+        if not transaction:
+            return jsonify({'error': 'Invalid transaction ID'}), 404
         
-        # Verify hash before decryption
-        if hashlib.sha256(encrypted_file).hexdigest() != transaction['hash_value']:
+        # Decrypt AES key using X25519, then the file using AES.
+        # GCM tags authenticate both, so tampering surfaces here
+        try:
+            aes_key = x25519.decrypt(transaction['encrypted_aes_key'], transaction['private_key'])
+            compressed_data = aes_crypto.decrypt(transaction['encrypted_file'], aes_key)
+        except InvalidTag:
             db_manager.delete_transaction(transaction_id)
-            logger.error("Hash verification failed")
+            logger.error("AES-GCM authentication failed")
             return jsonify({'error': 'Data tampered – access denied'}), 400
-        
-        logger.info("Hash verification successful")
-        
-        compressed_data = aes_crypto.decrypt(encrypted_file, aes_key)
-        logger.info("File decrypted using AES")
+        logger.debug("AES key decrypted using X25519, file decrypted using AES")
         
         # Decompress using Huffman
-        huffman = HuffmanCompression()
-        huffman_tree = base64.b64decode(transaction['huffman_tree'].encode())
-        huffman.set_tree(huffman_tree)
-        original_data = huffman.decompress(compressed_data)
-        logger.info("File decompressed using Huffman")
-        
-        # Update transaction status before preparing response
-        db_manager.update_transaction_status(transaction_id, 'ACCESSED', receiver_name, user_agent)
-        
-        # Enhanced logging for receiver access
-        logger.info("Decryption successful")
-        if receiver_name:
-            logger.info(f"File accessed by: {receiver_name}")
-        logger.info(f"Access time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        if user_agent:
-            logger.info(f"User agent: {user_agent}")
+        original_data = HuffmanCompression().decompress(compressed_data, transaction['huffman_tree'])
+        logger.debug("File decompressed using Huffman")
+        
+        # Update transaction status before preparing response, handing back the attempt
+        # claimed above since it succeeded
+        db_manager.record_access(transaction_id, 'ACCESSED', receiver_name, increment=-1)
         
         # Prepare response based on file type
         file_name = transaction['file_name']
-        file_ext = os.path.splitext(file_name)[1].lower()
-        
-        if file_ext == '.pdf':
+        if file_extension(file_name) == '.pdf':
             # For PDF, provide download
             response_data = {
                 'success': True,
@@ -289,12 +274,13 @@ def decrypt_file():
             db_manager.store_temp_file(transaction_id, original_data, file_name)
         
         # Note: Transaction will be deleted after download (one-time access)
-        logger.info("File prepared for access - transaction marked as ACCESSED")
+        logger.info("Decrypt tid=%s receiver=%r size=%d user_agent=%r elapsed=%.2fms", transaction_id, receiver_name,
+                    len(original_data), user_agent, (time.perf_counter() - start_time) * 1000)
         
         return jsonify(response_data)
         
     except Exception as e:
-        logger.error(f"Decryption error: {str(e)}")
+        logger.error("Decryption error: %s", e)
         return jsonify({'error': 'Decryption failed'}), 500
 
 @app.route('/download/<transaction_id>')
@@ -307,36 +293,24 @@ def download_file(transaction_id):
         
         # Get file extension to determine MIME type
         file_name = file_data['name']
-        file_ext = os.path.splitext(file_name)[1].lower()
-        
-        if file_ext == '.pdf':
-            mimetype = 'application/pdf'
-        elif file_ext in ['.jpg', '.jpeg']:
-            mimetype = 'image/jpeg'
-        elif file_ext == '.png':
-            mimetype = 'image/png'
-        elif file_ext == '.gif':
-            mimetype = 'image/gif'
-        else:
-            mimetype = 'application/octet-stream'
+        mimetype = MIME_TYPES.get(file_extension(file_name), 'application/octet-stream')
         
         # Clean up temp file and delete transaction (one-time access)
         db_manager.delete_temp_file(transaction_id)
-        db_manager.update_transaction_status(transaction_id, 'DOWNLOADED')
         db_manager.delete_transaction(transaction_id)
         
-        logger.info(f"File downloaded: {file_name}")
+        logger.info("File downloaded: %s", file_name)
         logger.info("One-time access completed - all data deleted")
         
         # Return file for download
         return send_file(
-            BytesIO(file_data['data']),
+            file_data['file'],
             as_attachment=True,
             download_name=file_name,
             mimetype=mimetype
         )
     except Exception as e:
-        logger.error(f"Download error: {str(e)}")
+        logger.error("Download error: %s", e)
         return "Download failed", 500
 
 # === NEW SESSION-BASED E2E ENCRYPTION ROUTES ===
@@ -370,7 +344,7 @@ def create_session():
         qr_url = f"{server_url}join_session?sid={session_id}"
         qr_code_data = generate_qr_code(qr_url)
         
-        logger.info(f"Session created: {session_id} by {sender_id}")
+        logger.info("Session created: %s by %s", session_id, sender_id)
         
         return jsonify({
             'success': True,
@@ -381,7 +355,7 @@ def create_session():
         })
         
     except Exception as e:
-        logger.error(f"Session creation error: {str(e)}")
+        logger.error("Session creation error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/join_session')
@@ -429,7 +403,6 @@ def generate_keypair():
         
         # Generate ElGamal key pair ON THE CLIENT SIDE (this is just for demo)
         # In real implementation, this would be done in JavaScript
-        elgamal = ElGamalCrypto()
         public_key_bytes, private_key_bytes = elgamal.generate_keypair()
         
         # Extract public key components
@@ -439,7 +412,7 @@ def generate_keypair():
         # Store ONLY public key in database (private key never sent to server)
         db_manager.store_session_public_key(session_id, str(p), str(g), str(y))
         
-        logger.info(f"Public key generated for session: {session_id}")
+        logger.info("Public key generated for session: %s", session_id)
         logger.info("CRITICAL: Private key generated on client side, never sent to server")
         
         # Return private key to client (in real implementation, this stays in browser)
@@ -453,7 +426,7 @@ def generate_keypair():
         })
         
     except Exception as e:
-        logger.error(f"Key generation error: {str(e)}")
+        logger.error("Key generation error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/get_public_key/<session_id>')
@@ -486,7 +459,7 @@ def get_public_key(session_id):
         })
         
     except Exception as e:
-        logger.error(f"Public key retrieval error: {str(e)}")
+        logger.error("Public key retrieval error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/session_upload', methods=['POST'])
@@ -520,53 +493,44 @@ def session_upload():
             return jsonify({'error': 'No file selected'}), 400
         
         # Validate file type
-        allowed_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.pdf'}
-        file_ext = os.path.splitext(file.filename)[1].lower()
-        if file_ext not in allowed_extensions:
+        if file_extension(file.filename) not in MIME_TYPES:
             return jsonify({'error': 'Only images (JPG, PNG, GIF) and PDF files are allowed'}), 400
         
-        # Read file data
-        file_data = file.read()
-        original_size = len(file_data)
+        # Measure the upload; the data itself is streamed through compression + encryption
+        stream = file.stream
+        stream.seek(0, os.SEEK_END)
+        original_size = stream.tell()
+        stream.seek(0)
+        
+        # Step 1: Generate random AES key
+        aes_key = aes_crypto.generate_key()
         
-        # Step 1: Compress file using Huffman coding
+        # Steps 2-3: Compress file using Huffman coding and encrypt it using AES, chunk by chunk
         huffman = HuffmanCompression()
-        compressed_data = huffman.compress(file_data)
-        compressed_size = len(compressed_data)
+        encrypted_file = aes_crypto.encrypt_stream(huffman.compress_stream(stream), aes_key)
+        compressed_size = len(encrypted_file) - aes_crypto.nonce_size - aes_crypto.tag_size
         compression_ratio = ((original_size - compressed_size) / original_size) * 100 if original_size > 0 else 0.0
         
-        logger.info(f"File compressed: {original_size} -> {compressed_size} bytes ({compression_ratio:.2f}%)")
-        
-        # Step 2: Generate random AES key
-        aes_crypto = AESCrypto()
-        aes_key = aes_crypto.generate_key()
-        
-        # Step 3: Encrypt compressed file using AES
-        encrypted_file = aes_crypto.encrypt(compressed_data, aes_key)
+        logger.info("File compressed: %d -> %d bytes (%.2f%%)", original_size, compressed_size, compression_ratio)
         
         # Step 4: Encrypt AES key using receiver's public key
-        elgamal = ElGamalCrypto()
         public_key = (int(session['public_key_p']), int(session['public_key_g']), int(session['public_key_y']))
         public_key_bytes = elgamal._serialize_key(public_key)
         encrypted_aes_key = elgamal.encrypt(aes_key, public_key_bytes)
         
-        # Step 5: Generate hash of encrypted file for integrity
-        hash_value = hashlib.sha256(encrypted_file).hexdigest()
-        
         # Store encrypted data in session
         db_manager.store_session_encrypted_data(
             session_id=session_id,
-            encrypted_file=base64.b64encode(encrypted_file).decode(),
-            encrypted_aes_key=base64.b64encode(encrypted_aes_key).decode(),
-            hash_value=hash_value,
+            encrypted_file=encrypted_file,
+            encrypted_aes_key=encrypted_aes_key,
             file_name=file.filename,
-            huffman_tree=base64.b64encode(huffman.get_tree()).decode(),
+            huffman_tree=huffman.get_tree(),
             original_size=original_size,
             compressed_size=compressed_size,
             compression_ratio=compression_ratio
         )
         
-        logger.info(f"File uploaded and encrypted for session: {session_id}")
+        logger.info("File uploaded and encrypted for session: %s", session_id)
         logger.info("CRITICAL: No private keys stored on server")
         
         return jsonify({
@@ -580,7 +544,7 @@ def session_upload():
         })
         
     except Exception as e:
-        logger.error(f"Session upload error: {str(e)}")
+        logger.error("Session upload error: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/session_decrypt', methods=['POST'])
@@ -608,32 +572,22 @@ def session_decrypt():
         if not session['encrypted_file']:
             return jsonify({'error': 'No file uploaded yet'}), 400
         
-        # Verify hash BEFORE decryption
-        encrypted_file = base64.b64decode(session['encrypted_file'].encode())
-        if hashlib.sha256(encrypted_file).hexdigest() != session['hash_value']:
-            logger.error("Hash verification failed")
-            return jsonify({'error': 'Data tampered - access denied'}), 400
-        
-        logger.info("Hash verification successful")
-        
         # Reconstruct private key
-        elgamal = ElGamalCrypto()
         private_key = (int(private_key_data['p']), int(private_key_data['g']), int(private_key_data['x']))
         private_key_bytes = elgamal._serialize_key(private_key)
         
         # Decrypt AES key using private key
-        encrypted_aes_key = base64.b64decode(session['encrypted_aes_key'].encode())
-        aes_key = elgamal.decrypt(encrypted_aes_key, private_key_bytes)
+        aes_key = elgamal.decrypt(session['encrypted_aes_key'], private_key_bytes)
         
         # Decrypt file using AES
-        aes_crypto = AESCrypto()
-        compressed_data = aes_crypto.decrypt(encrypted_file, aes_key)
+        try:
+            compressed_data = aes_crypto.decrypt(session['encrypted_file'], aes_key)
+        except InvalidTag:
+            logger.error("AES-GCM authentication failed")
+            return jsonify({'error': 'Data tampered - access denied'}), 400
         
         # Decompress using Huffman
-        huffman = HuffmanCompression()
-        huffman_tree = base64.b64decode(session['huffman_tree'].encode())
-        huffman.set_tree(huffman_tree)
-        original_data = huffman.decompress(compressed_data)
+        original_data = HuffmanCompression().decompress(compressed_data, session['huffman_tree'])
         
         # Mark session as accessed
         db_manager.mark_session_accessed(session_id)
@@ -641,14 +595,12 @@ def session_decrypt():
         # Store temp file for download
         db_manager.store_temp_file(session_id, original_data, session['file_name'])
         
-        logger.info(f"File decrypted successfully for session: {session_id}")
+        logger.info("File decrypted successfully for session: %s", session_id)
         logger.info("CRITICAL: Private key used locally, never sent to server")
         
         # Prepare response based on file type
         file_name = session['file_name']
-        file_ext = os.path.splitext(file_name)[1].lower()
-        
-        if file_ext == '.pdf':
+        if file_extension(file_name) == '.pdf':
             response_data = {
                 'success': True,
                 'file_type': 'pdf',
@@ -668,7 +620,7 @@ def session_decrypt():
         return jsonify(response_data)
         
     except Exception as e:
-        logger.error(f"Session decryption error: {str(e)}")
+        logger.error("Session decryption error: %s", e)
         return jsonify({'error': 'Decryption failed'}), 500
 
 @app.route('/session_download/<session_id>')
@@ -681,35 +633,24 @@ def session_download(session_id):
         
         # Get file extension for MIME type
         file_name = file_data['name']
-        file_ext = os.path.splitext(file_name)[1].lower()
-        
-        if file_ext == '.pdf':
-            mimetype = 'application/pdf'
-        elif file_ext in ['.jpg', '.jpeg']:
-            mimetype = 'image/jpeg'
-        elif file_ext == '.png':
-            mimetype = 'image/png'
-        elif file_ext == '.gif':
-            mimetype = 'image/gif'
-        else:
-            mimetype = 'application/octet-stream'
+        mimetype = MIME_TYPES.get(file_extension(file_name), 'application/octet-stream')
         
         # Clean up
         db_manager.delete_temp_file(session_id)
         db_manager.delete_session(session_id)  # One-time access
         
-        logger.info(f"Session file downloaded: {file_name}")
+        logger.info("Session file downloaded: %s", file_name)
         logger.info("Session deleted after one-time access")
         
         return send_file(
-            BytesIO(file_data['data']),
+            file_data['file'],
             as_attachment=True,
             download_name=file_name,
             mimetype=mimetype
         )
         
     except Exception as e:
-        logger.error(f"Session download error: {str(e)}")
+        logger.error("Session download error: %s", e)
         return "Download failed", 500
 
 @app.route('/session_status/<session_id>')
@@ -731,7 +672,7 @@ def session_status(session_id):
         })
         
     except Exception as e:
-        logger.error(f"Session status error: {str(e)}")
+        logger.error("Session status error: %s", e)
         return jsonify({'error': 'Status check failed'}), 500
 
 # === ORIGINAL ROUTES (kept for compatibility) ===
@@ -740,7 +681,7 @@ def session_status(session_id):
 def check_status(transaction_id):
     """Check transaction status for sender"""
     try:
-        transaction = db_manager.get_transaction(transaction_id)
+        transaction = db_manager.get_transaction_meta(transaction_id)
         if not transaction:
             return jsonify({'error': 'Transaction not found or expired'}), 404
         
@@ -757,36 +698,61 @@ def check_status(transaction_id):
             response_data.update({
                 'receiver_name': transaction['receiver_name'],
                 'access_time': transaction['access_time'],
-                'user_agent': transaction['user_agent']
+                'user_agent': transaction.get('user_agent', '')
             })
         
         return jsonify(response_data)
         
     except Exception as e:
-        logger.error(f"Status check error: {str(e)}")
+        logger.error("Status check error: %s", e)
         return jsonify({'error': 'Status check failed'}), 500
 
+PIN_ALPHABET = string.ascii_uppercase + string.digits
+
+# Allowed upload types and the MIME type each is served with
+MIME_TYPES = {
+    '.pdf': 'application/pdf',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif'
+}
+
+def file_extension(file_name):
+    """Return the lower-cased extension of a file name (with the dot), or '' if it has none"""
+    head, dot, ext = file_name.rpartition('.')
+    return dot + ext.lower() if head else ''
+
 def generate_pin():
     """Generate 6-digit alphanumeric PIN"""
-    import random
-    import string
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+    # secrets draws from the OS CSPRNG; random's Mersenne Twister is predictable
+    return ''.join(secrets.choice(PIN_ALPHABET) for _ in range(6))
+
+# (URL prefix, length) -> (version, error level, mask) of the first QR code built for it
+QR_LAYOUT_CACHE = {}
+QR_LAYOUT_CACHE_SIZE = 64
 
 def generate_qr_code(data):
-    """Generate QR code as base64 image"""
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(data)
-    qr.make(fit=True)
+    """Generate QR code as an SVG data URI"""
+    # URLs differ only in the trailing ID, so reuse the version and mask chosen for the first
+    # one instead of scoring all eight masks on every call
+    key = (data.rpartition('=')[0], len(data))
+    layout = QR_LAYOUT_CACHE.get(key)
+    if layout:
+        version, error, mask = layout
+        qr = segno.make_qr(data, version=version, error=error, mask=mask, boost_error=False)
+    else:
+        qr = segno.make_qr(data, error='m')
+        if len(QR_LAYOUT_CACHE) >= QR_LAYOUT_CACHE_SIZE:
+            QR_LAYOUT_CACHE.clear()
+        QR_LAYOUT_CACHE[key] = (qr.version, qr.error, qr.mask)
     
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffered = BytesIO()
-    img.save(buffered, format="PNG")
-    img_str = base64.b64encode(buffered.getvalue()).decode()
-    return f"data:image/png;base64,{img_str}"
+    # A single SVG path renders identically in <img> and skips PNG/zlib encoding
+    return qr.svg_data_uri(scale=10, border=5)
 
 if __name__ == '__main__':
     # Initialize database
     db_manager.init_database()
     
-    # Run the application
-    app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
+    # Run the application (one thread per request, so a large upload doesn't block others)
+    app.run(debug=True, host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
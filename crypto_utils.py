@@ -1,16 +1,34 @@
 #!/usr/bin/env python3
 """
 Cryptographic utilities for CNS project
-Implements Huffman Compression, AES, and ElGamal encryption
+Implements Huffman Compression, AES, ElGamal, and X25519 key wrapping
 """
 
 import heapq
-import pickle
 import secrets
-import random
-from Crypto.Cipher import AES
-from Crypto.Util.Padding import pad, unpad
-from Crypto.Random import get_random_bytes
+import struct
+import zlib
+from array import array
+from collections import Counter
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric.x25519 import X25519PrivateKey, X25519PublicKey
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.hazmat.primitives.serialization import Encoding, NoEncryption, PrivateFormat, PublicFormat
+
+try:
+    # Optional C bit-packer for Huffman coding; the pure-Python coder is used without it
+    from bitarray import bitarray, decodetree
+except ImportError:
+    bitarray = None
+
+try:
+    # Optional GMP bindings for ElGamal prime generation; pure-Python Miller-Rabin otherwise
+    import gmpy2
+except ImportError:
+    gmpy2 = None
 
 
 class HuffmanNode:
@@ -25,16 +43,19 @@ class HuffmanNode:
 
 
 class HuffmanCompression:
+    LUT_BITS = 12  # Width of the prefix lookup table used for decoding
+    STORED = 0xFF  # Header byte for data kept uncompressed (padding is always 0-7)
+    CHUNK_SIZE = 64 * 1024  # Input bytes encoded per step
+    
     def __init__(self):
         self.tree = None
         self.codes = {}
+        self.code_lengths = array('B', bytes(256))  # Code length per byte value (0 = unused)
     
     def _build_frequency_table(self, data):
         """Build frequency table for input data"""
-        freq_table = {}
-        for byte in data:
-            freq_table[byte] = freq_table.get(byte, 0) + 1
-        return freq_table
+        # Counter tallies the bytes in C instead of a Python-level dict update per byte
+        return Counter(data)
     
     def _build_huffman_tree(self, freq_table):
         """Build Huffman tree from frequency table"""
@@ -55,151 +76,341 @@ class HuffmanCompression:
         
         return heap[0]
     
-    def _generate_codes(self, root, code="", codes=None):
-        """Generate Huffman codes for each character"""
-        if codes is None:
-            codes = {}
-        
-        if root is not None:
-            if root.char is not None:  # Leaf node
-                codes[root.char] = code if code else "0"  # Handle single character case
+    def _compute_code_lengths(self, root):
+        """Record each leaf's depth in the tree as its code length (iteratively, no recursion)"""
+        lengths = array('B', bytes(256))
+        stack = [(root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if node.char is not None:  # Leaf node
+                lengths[node.char] = depth or 1  # Handle single character case
             else:
-                self._generate_codes(root.left, code + "0", codes)
-                self._generate_codes(root.right, code + "1", codes)
-        
+                stack.append((node.left, depth + 1))
+                stack.append((node.right, depth + 1))
+        return lengths
+    
+    def _generate_codes(self, lengths):
+        """Assign canonical Huffman codes: ordered by (length, symbol), consecutive within a length"""
+        bl_count = Counter(length for length in lengths if length)
+        if not bl_count:
+            return {}
+        next_code = {}
+        code = 0
+        for bits in range(1, max(bl_count) + 1):
+            code = (code + bl_count[bits - 1]) << 1
+            next_code[bits] = code
+        
+        codes = {}
+        for symbol, length in enumerate(lengths):
+            if length:
+                codes[symbol] = format(next_code[length], f'0{length}b')
+                next_code[length] += 1
         return codes
     
     def compress(self, data):
         """Compress data using Huffman coding"""
-        if not data:
-            self.tree = None
-            self.codes = {}
-            return b''
+        view = memoryview(data)
+        size = self.CHUNK_SIZE
+        return b''.join(self._compress_chunks(
+            lambda: (view[i:i + size] for i in range(0, len(view), size))))
+    
+    def compress_stream(self, stream):
+        """Compress a seekable binary stream, yielding the output piece by piece
+        
+        The stream is read twice from its current position (frequency count,
+        then encoding), so the input is never held in memory as a whole.
+        The tree is available via get_tree() once the generator is exhausted.
+        """
+        start = stream.tell()
+        
+        def chunks():
+            stream.seek(start)
+            return iter(lambda: stream.read(self.CHUNK_SIZE), b'')
         
+        return self._compress_chunks(chunks)
+    
+    def _compress_chunks(self, chunks):
+        """Huffman-code the input returned by chunks(), which is called once per pass"""
         # Build frequency table
-        freq_table = self._build_frequency_table(data)
+        freq_table = Counter()
+        for chunk in chunks():
+            freq_table.update(self._build_frequency_table(chunk))
+        
+        if not freq_table:
+            self.tree = None
+            self.codes = {}
+            self.code_lengths = array('B', bytes(256))
+            return
         
         # Build Huffman tree
         self.tree = self._build_huffman_tree(freq_table)
         
-        # Generate codes
-        self.codes = self._generate_codes(self.tree)
+        # Generate codes (canonical, so the code lengths alone determine them)
+        self.code_lengths = self._compute_code_lengths(self.tree)
+        self.codes = self._generate_codes(self.code_lengths)
         
-        # Encode data
-        encoded_bits = ""
-        for byte in data:
-            encoded_bits += self.codes[byte]
+        # Already entropy-coded inputs (JPEG, PNG, most PDFs) don't shrink; the
+        # frequency table gives the encoded size up front, so skip encoding them
+        bit_count = sum(freq * len(self.codes[byte]) for byte, freq in freq_table.items())
+        if (bit_count + 7) // 8 >= sum(freq_table.values()):
+            self.tree = None
+            self.codes = {}
+            self.code_lengths = array('B', bytes(256))
+            yield bytes([self.STORED])
+            for chunk in chunks():
+                yield bytes(chunk)
+            return
         
-        # Pad to make it byte-aligned
-        padding = 8 - len(encoded_bits) % 8
-        if padding != 8:
-            encoded_bits += "0" * padding
+        # Store padding info in first byte
+        yield bytes([(8 - bit_count % 8) % 8])
+        
+        if bitarray is not None:
+            # bitarray looks up and packs each code in C; whole bytes are emitted per
+            # chunk and the leftover bits start the next chunk's buffer
+            codebook = {byte: bitarray(code, endian='big') for byte, code in self.codes.items()}
+            carry = bitarray(endian='big')
+            for chunk in chunks():
+                carry.encode(codebook, chunk)
+                whole = len(carry) - len(carry) % 8
+                if whole:
+                    yield carry[:whole].tobytes()
+                    del carry[:whole]
+            if carry:
+                yield carry.tobytes()  # zero-pads the final byte
+            return
+        
+        # Encode data: look every byte up in a 256-entry code table and join in C,
+        # then pack each chunk's bit string in one int conversion. Bits that don't
+        # fill a whole byte are carried over to the next chunk.
+        code_table = [self.codes.get(byte, '') for byte in range(256)]
+        carry = ''
+        for chunk in chunks():
+            encoded_bits = carry + ''.join(map(code_table.__getitem__, chunk))
+            whole = len(encoded_bits) - len(encoded_bits) % 8
+            if whole:
+                yield int(encoded_bits[:whole], 2).to_bytes(whole // 8, byteorder='big')
+            carry = encoded_bits[whole:]
         
-        # Convert to bytes
-        compressed = bytearray()
-        for i in range(0, len(encoded_bits), 8):
-            byte_str = encoded_bits[i:i+8]
-            compressed.append(int(byte_str, 2))
+        # Pad to make it byte-aligned
+        if carry:
+            yield int(carry.ljust(8, '0'), 2).to_bytes(1, byteorder='big')
+    
+    def _build_decode_table(self):
+        """Build prefix lookup tables for decoding
+        
+        Returns (table, multi_table, long_codes): table maps each LUT_BITS-bit
+        window to (symbol, code length); multi_table maps it to (symbols, bits used)
+        for every code that fits in the window, so short codes decode several at a
+        time. Codes longer than LUT_BITS leave their slots as None and are looked up
+        by (length, value) in long_codes.
+        """
+        lut_mask = (1 << self.LUT_BITS) - 1
+        table = [None] * (1 << self.LUT_BITS)
+        long_codes = {}
+        for char, code in self.codes.items():
+            length = len(code)
+            if length <= self.LUT_BITS:
+                span = 1 << (self.LUT_BITS - length)
+                start = int(code, 2) * span
+                table[start:start + span] = [(char, length)] * span
+            else:
+                long_codes[(length, int(code, 2))] = char
         
-        # Store padding info in first byte
-        result = bytearray([padding])
-        result.extend(compressed)
+        multi_table = [None] * (1 << self.LUT_BITS)
+        for window, entry in enumerate(table):
+            if entry is None:
+                continue
+            symbols = [entry[0]]
+            used = entry[1]
+            while True:
+                entry = table[(window << used) & lut_mask]
+                if entry is None or used + entry[1] > self.LUT_BITS:
+                    break
+                symbols.append(entry[0])
+                used += entry[1]
+            multi_table[window] = (bytes(symbols), used)
         
-        return bytes(result)
+        return table, multi_table, long_codes
     
-    def decompress(self, compressed_data):
-        """Decompress data using stored Huffman tree"""
-        if not compressed_data or self.tree is None:
+    def decompress(self, compressed_data, tree_data=None):
+        """Decompress data using the current codebook (or the serialized tree_data, if given)"""
+        if tree_data is not None:
+            self.set_tree(tree_data)
+        
+        if not compressed_data:
             return b''
         
-        if self.tree.char is not None:  # Single character case
-            # Extract length info and reconstruct
-            padding = compressed_data[0]
-            bit_count = (len(compressed_data) - 1) * 8 - padding
-            return bytes([self.tree.char] * (bit_count if bit_count > 0 else self.tree.freq))
+        if compressed_data[0] == self.STORED:
+            return compressed_data[1:]
+        
+        if not self.codes:
+            return b''
         
         # Extract padding info
         padding = compressed_data[0]
-        compressed_data = compressed_data[1:]
-        
-        # Convert to bits
-        encoded_bits = ""
-        for byte in compressed_data:
-            encoded_bits += format(byte, '08b')
-        
-        # Remove padding
-        if padding > 0:
-            encoded_bits = encoded_bits[:-padding]
+        bit_count = (len(compressed_data) - 1) * 8 - padding
+        
+        if len(self.codes) == 1:  # Single character case: one 1-bit code per byte
+            return bytes([next(iter(self.codes))]) * bit_count
+        
+        if bitarray is not None:
+            bits = bitarray(endian='big')
+            bits.frombytes(memoryview(compressed_data)[1:])
+            if padding:
+                del bits[-padding:]
+            codebook = {byte: bitarray(code, endian='big') for byte, code in self.codes.items()}
+            return bytes(bits.decode(decodetree(codebook)))
+        
+        # Decode with the prefix tables, up to LUT_BITS at a time instead of one bit per step
+        lut_bits = self.LUT_BITS
+        lut_mask = (1 << lut_bits) - 1
+        table, multi_table, long_codes = self._build_decode_table()
+        max_length = max(len(code) for code in self.codes.values())
+        end = len(compressed_data)
         
-        # Decode using tree
         decoded = bytearray()
-        current = self.tree
-        
-        for bit in encoded_bits:
-            if bit == "0":
-                current = current.left
+        buffer = 0
+        buffered = 0
+        pos = 1
+        remaining = bit_count
+        
+        while remaining > 0:
+            while buffered < lut_bits:
+                buffer = (buffer << 8) | (compressed_data[pos] if pos < end else 0)
+                pos += 1
+                buffered += 8
+            
+            window = (buffer >> (buffered - lut_bits)) & lut_mask
+            entry = multi_table[window]
+            if entry is not None and entry[1] <= remaining:
+                # Every symbol whose code fits in the window
+                symbols, length = entry
+                decoded += symbols
             else:
-                current = current.right
+                # Near the end of the data (where the window runs into padding) or a long code:
+                # decode a single symbol
+                entry = table[window]
+                if entry is None:
+                    # Long code: try each length past the table width
+                    while buffered < max_length:
+                        buffer = (buffer << 8) | (compressed_data[pos] if pos < end else 0)
+                        pos += 1
+                        buffered += 8
+                    for length in range(lut_bits + 1, max_length + 1):
+                        char = long_codes.get((length, buffer >> (buffered - length)))
+                        if char is not None:
+                            break
+                else:
+                    char, length = entry
+                decoded.append(char)
             
-            if current.char is not None:  # Leaf node
-                decoded.append(current.char)
-                current = self.tree
+            buffered -= length
+            remaining -= length
+            buffer &= (1 << buffered) - 1
         
         return bytes(decoded)
     
     def get_tree(self):
-        """Serialize Huffman tree for storage"""
-        return pickle.dumps((self.tree, self.codes))
+        """Serialize the codebook for storage as its 256 code lengths (canonical codes need nothing else)
+        
+        The lengths are mostly zeros and repeats, so they are zlib-compressed (typically to 10-100 bytes).
+        """
+        return zlib.compress(bytes(self.code_lengths), 9)
     
     def set_tree(self, tree_data):
-        """Deserialize Huffman tree from storage"""
-        self.tree, self.codes = pickle.loads(tree_data)
+        """Rebuild the codebook from storage"""
+        if tree_data[:1] == b'\x78':
+            # zlib header; a code length is never 0x78, so uncompressed arrays are still read as is
+            tree_data = zlib.decompress(tree_data)
+        if len(tree_data) != 256:
+            raise ValueError("Unknown Huffman tree format")
+        
+        self.tree = None
+        self.code_lengths = array('B', tree_data)
+        self.codes = self._generate_codes(self.code_lengths)
 
 
 class AESCrypto:
     def __init__(self):
         self.key_size = 32  # 256-bit key
+        self.nonce_size = 12  # 96-bit GCM nonce
+        self.tag_size = 16  # 128-bit GCM authentication tag
     
     def generate_key(self):
         """Generate random AES key"""
-        return get_random_bytes(self.key_size)
+        return secrets.token_bytes(self.key_size)
     
     def encrypt(self, data, key):
-        """Encrypt data using AES in CBC mode"""
-        print("AESkey:", key)
-        cipher = AES.new(key, AES.MODE_CBC)
-        padded_data = pad(data, AES.block_size)
-        ciphertext = cipher.encrypt(padded_data)
-        return cipher.iv + ciphertext
+        """Encrypt data using AES in GCM mode (OpenSSL, AES-NI when available)"""
+        nonce = secrets.token_bytes(self.nonce_size)
+        # One-shot AEAD call: AESGCM returns ciphertext || tag in a single buffer
+        return nonce + AESGCM(key).encrypt(nonce, data, None)
+    
+    def encrypt_stream(self, chunks, key):
+        """Encrypt an iterable of plaintext chunks using AES in GCM mode
+        
+        Produces the same nonce || ciphertext || tag layout as encrypt(), but
+        returns a bytearray built incrementally so the plaintext is never joined.
+        """
+        nonce = secrets.token_bytes(self.nonce_size)
+        cipher = Cipher(algorithms.AES(key), modes.GCM(nonce), backend=default_backend())
+        encryptor = cipher.encryptor()
+        encrypted = bytearray(nonce)
+        for chunk in chunks:
+            encrypted += encryptor.update(chunk)
+        encrypted += encryptor.finalize()
+        encrypted += encryptor.tag
+        return encrypted
     
     def decrypt(self, encrypted_data, key):
-        """Decrypt data using AES in CBC mode"""
-        iv = encrypted_data[:AES.block_size]
-        ciphertext = encrypted_data[AES.block_size:]
-        cipher = AES.new(key, AES.MODE_CBC, iv)
-        padded_plaintext = cipher.decrypt(ciphertext)
-        return unpad(padded_plaintext, AES.block_size)
+        """Decrypt data using AES in GCM mode
+        
+        Raises cryptography.exceptions.InvalidTag if the data was tampered with.
+        """
+        # Slice through a memoryview so the (possibly multi-MB) ciphertext is not copied
+        view = memoryview(encrypted_data)
+        nonce = bytes(view[:self.nonce_size])
+        return AESGCM(key).decrypt(nonce, view[self.nonce_size:], None)
 
 
 class ElGamalCrypto:
+    # Odd primes below 1000, used to reject most composite candidates before Miller-Rabin
+    SMALL_PRIMES = [n for n in range(3, 1000, 2) if all(n % d for d in range(3, int(n ** 0.5) + 1, 2))]
+    # First byte of a ciphertext
+    SINGLE_BLOCK = 0x01
+    HYBRID = 0x02
+    
     def __init__(self):
         self.key_size = 2048  # bits
     
     def _generate_prime(self, bits):
         """Generate a random prime number"""
         while True:
-            num = random.getrandbits(bits)
+            num = secrets.randbits(bits)
             num |= (1 << bits - 1) | 1  # Set MSB and LSB to 1
-            if self._is_prime(num):
+            if gmpy2 is not None:
+                # GMP sieves and tests successive candidates in C; keys stay plain ints
+                num = int(gmpy2.next_prime(num))
+                if num.bit_length() == bits:
+                    return num
+            elif self._is_prime(num):
                 return num
     
     def _is_prime(self, n, k=10):
         """Miller-Rabin primality test"""
+        if gmpy2 is not None:
+            return gmpy2.is_prime(n, k)
+        
         if n == 2 or n == 3:
             return True
         if n < 2 or n % 2 == 0:
             return False
         
+        # Trial division by small primes is far cheaper than a modular exponentiation
+        for p in self.SMALL_PRIMES:
+            if n % p == 0:
+                return n == p
+        
         # Write n-1 as d * 2^r
         r = 0
         d = n - 1
@@ -209,7 +420,7 @@ class ElGamalCrypto:
         
         # Perform k rounds of testing
         for _ in range(k):
-            a = random.randrange(2, n - 1)
+            a = 2 + secrets.randbelow(n - 3)  # Witness in [2, n-2]
             x = pow(a, d, n)
             
             if x == 1 or x == n - 1:
@@ -224,17 +435,29 @@ class ElGamalCrypto:
         
         return True
     
+    def _powmod(self, base, exponent, modulus):
+        """Modular exponentiation, through GMP when gmpy2 is installed
+        
+        The builtin pow already uses sliding-window exponentiation in C, so it is
+        the fallback rather than a hand-written Python window.
+        """
+        if gmpy2 is not None:
+            return int(gmpy2.powmod(base, exponent, modulus))
+        return pow(base, exponent, modulus)
+    
     def _find_generator(self, p):
         """Find a generator for the cyclic group Z*p"""
+        q = (p - 1) >> 1
+        
         # For simplicity, use a small generator that works for most primes
-        for g in [2, 3, 5, 7, 11, 13, 17, 19, 23]:
-            if pow(g, (p - 1) // 2, p) != 1:
+        for g in (2, 3, 5, 7, 11, 13, 17, 19, 23):
+            if self._powmod(g, q, p) != 1:
                 return g
         
         # If small generators don't work, find one randomly
         for _ in range(100):
-            g = random.randrange(2, p)
-            if pow(g, (p - 1) // 2, p) != 1:
+            g = 2 + secrets.randbelow(p - 2)
+            if self._powmod(g, q, p) != 1:
                 return g
         
         return 2  # Fallback
@@ -242,49 +465,79 @@ class ElGamalCrypto:
     def generate_keypair(self):
         """Generate ElGamal key pair"""
         # Generate large prime p
-        p = self._generate_prime(self.key_size // 8)  # Smaller for demo purposes
+        p = self._generate_prime(self.key_size)
         
         # Find generator g
         g = self._find_generator(p)
         
-        # Generate private key x
-        x = random.randrange(1, p - 1)
+        # Generate private key x (from the OS CSPRNG, like every random value here)
+        x = 1 + secrets.randbelow(p - 2)
         
         # Calculate public key y = g^x mod p
-        y = pow(g, x, p)
+        y = self._powmod(g, x, p)
         
         public_key = (p, g, y)
         private_key = (p, g, x)
         
         return self._serialize_key(public_key), self._serialize_key(private_key)
     
+    def _pack_ints(self, *values):
+        """Serialize non-negative ints as big-endian bytes, each behind a 4-byte length"""
+        packed = bytearray()
+        for value in values:
+            value_bytes = value.to_bytes((value.bit_length() + 7) // 8, byteorder='big')
+            packed += struct.pack('>I', len(value_bytes))
+            packed += value_bytes
+        return bytes(packed)
+    
+    def _unpack_fields(self, data):
+        """Split data written by _pack_ints into its byte fields"""
+        view = memoryview(data)
+        fields = []
+        pos = 0
+        while pos < len(view):
+            if pos + 4 > len(view):
+                raise ValueError("Truncated ElGamal data")
+            (length,) = struct.unpack_from('>I', view, pos)
+            pos += 4
+            if pos + length > len(view):
+                raise ValueError("Truncated ElGamal data")
+            fields.append(view[pos:pos + length])
+            pos += length
+        return fields
+    
+    def _unpack_ints(self, data):
+        """Deserialize ints written by _pack_ints"""
+        return tuple(int.from_bytes(field, byteorder='big') for field in self._unpack_fields(data))
+    
     def _serialize_key(self, key):
         """Serialize key tuple to bytes"""
-        return pickle.dumps(key)
+        return self._pack_ints(*key)
     
     def _deserialize_key(self, key_bytes):
         """Deserialize key from bytes"""
-        return pickle.loads(key_bytes)
+        key = self._unpack_ints(key_bytes)
+        if len(key) != 3:
+            raise ValueError("Unknown ElGamal key format")
+        return key
     
     def encrypt(self, data, public_key_bytes):
         """Encrypt data using ElGamal public key"""
-        p, g, y = self._deserialize_key(public_key_bytes)
-        
-        # Convert data to integer
-        data_int = int.from_bytes(data, byteorder='big')
+        # Deserialized once; the tuple is handed down to _encrypt_block as is
+        public_key = self._deserialize_key(public_key_bytes)
+        p = public_key[0]
         
-        # If data is too large, split into blocks
+        # If data is too large for one block, encrypt it under a fresh AES key and
+        # ElGamal-encrypt only that key: one pair of modexps instead of a pair per block
         max_block_size = (p.bit_length() - 1) // 8
         if len(data) > max_block_size:
-            # For simplicity in this demo, we'll use a different approach
-            # Encrypt the data in smaller chunks
-            blocks = []
-            for i in range(0, len(data), max_block_size):
-                block = data[i:i + max_block_size]
-                blocks.append(self._encrypt_block(block, (p, g, y)))
-            return pickle.dumps(blocks)
+            aes = AESCrypto()
+            session_key = aes.generate_key()
+            key_block = self._encrypt_block(session_key, public_key)
+            aes_ciphertext = aes.encrypt(data, session_key)
+            return bytes([self.HYBRID]) + struct.pack('>I', len(key_block)) + key_block + aes_ciphertext
         else:
-            return self._encrypt_block(data, (p, g, y))
+            return bytes([self.SINGLE_BLOCK]) + self._encrypt_block(data, public_key)
     
     def _encrypt_block(self, data, public_key):
         """Encrypt a single block of data"""
@@ -297,52 +550,92 @@ class ElGamalCrypto:
         if data_int >= p:
             raise ValueError("Data too large for key size")
         
-        # Generate random k
-        k = random.randrange(1, p - 1)
+        # Generate random k (a predictable k reveals the plaintext)
+        k = 1 + secrets.randbelow(p - 2)
         
         # Calculate ciphertext
-        c1 = pow(g, k, p)
-        c2 = (data_int * pow(y, k, p)) % p
+        c1 = self._powmod(g, k, p)
+        c2 = (data_int * self._powmod(y, k, p)) % p
         
-        return pickle.dumps((c1, c2))
+        # Keep the length so leading zero bytes survive the round trip through an integer
+        return self._pack_ints(c1, c2, len(data))
     
     def decrypt(self, encrypted_data, private_key_bytes):
         """Decrypt data using ElGamal private key"""
-        p, g, x = self._deserialize_key(private_key_bytes)
-        
-        try:
-            # Try to unpickle as blocks first
-            blocks = pickle.loads(encrypted_data)
-            if isinstance(blocks, list):
-                # Multiple blocks
-                decrypted_data = b''
-                for block_data in blocks:
-                    decrypted_data += self._decrypt_block(block_data, (p, g, x))
-                return decrypted_data
-            else:
-                # Single block (backwards compatibility)
-                return self._decrypt_block(encrypted_data, (p, g, x))
-        except:
-            # Single block
-            return self._decrypt_block(encrypted_data, (p, g, x))
+        private_key = self._deserialize_key(private_key_bytes)
+        
+        view = memoryview(encrypted_data)
+        if not view:
+            raise ValueError("Empty ElGamal ciphertext")
+        if view[0] == self.SINGLE_BLOCK:
+            return self._decrypt_block(view[1:], private_key)
+        if view[0] == self.HYBRID:
+            # ElGamal-encrypted AES key (length-prefixed) + AES-GCM ciphertext
+            key_length = int.from_bytes(view[1:5], byteorder='big')
+            key_block = view[5:5 + key_length]
+            if len(view) < 5 or len(key_block) != key_length:
+                raise ValueError("Truncated ElGamal data")
+            return AESCrypto().decrypt(view[5 + key_length:], self._decrypt_block(key_block, private_key))
+        raise ValueError("Unknown ElGamal ciphertext format")
     
     def _decrypt_block(self, encrypted_block, private_key):
         """Decrypt a single block of data"""
         p, g, x = private_key
-        c1, c2 = pickle.loads(encrypted_block)
+        block = self._unpack_ints(encrypted_block)
+        if len(block) != 3:
+            raise ValueError("Unknown ElGamal block format")
+        c1, c2, length = block
         
         # Calculate shared secret
-        s = pow(c1, x, p)
+        s = self._powmod(c1, x, p)
         
         # Calculate modular inverse of s
-        s_inv = pow(s, p - 2, p)  # Using Fermat's little theorem
+        s_inv = pow(s, -1, p)  # Extended Euclid, much cheaper than the Fermat exponentiation s^(p-2)
         
         # Recover plaintext
         plaintext_int = (c2 * s_inv) % p
         
         # Convert back to bytes
-        byte_length = (plaintext_int.bit_length() + 7) // 8
-        if byte_length == 0:
-            return b'\x00'
-        
-        return plaintext_int.to_bytes(byte_length, byteorder='big')
\ No newline at end of file
+        return plaintext_int.to_bytes(length, byteorder='big')
+
+class X25519Crypto:
+    """Hybrid key wrapping: ephemeral X25519 exchange + HKDF-SHA256 + AES-GCM
+    
+    Same generate_keypair/encrypt/decrypt interface as ElGamalCrypto, with
+    raw 32-byte keys instead of packed big integers.
+    """
+    
+    def __init__(self):
+        self.key_size = 32  # raw X25519 public/private key length
+        self.info = b'Image_Transfer_QR key wrap'
+        self.aes = AESCrypto()
+    
+    def generate_keypair(self):
+        """Generate an X25519 key pair as raw (public, private) bytes"""
+        private_key = X25519PrivateKey.generate()
+        private_bytes = private_key.private_bytes(Encoding.Raw, PrivateFormat.Raw, NoEncryption())
+        public_bytes = private_key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+        return public_bytes, private_bytes
+    
+    def _derive_key(self, shared_secret, ephemeral_public, public_bytes):
+        """Derive the wrapping key from the shared secret, bound to both public keys"""
+        hkdf = HKDF(algorithm=hashes.SHA256(), length=self.aes.key_size, salt=None,
+                    info=self.info + ephemeral_public + public_bytes)
+        return hkdf.derive(shared_secret)
+    
+    def encrypt(self, data, public_key_bytes):
+        """Encrypt data to the given public key: ephemeral public key || AES-GCM ciphertext"""
+        ephemeral = X25519PrivateKey.generate()
+        ephemeral_public = ephemeral.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+        shared_secret = ephemeral.exchange(X25519PublicKey.from_public_bytes(public_key_bytes))
+        key = self._derive_key(shared_secret, ephemeral_public, public_key_bytes)
+        return ephemeral_public + self.aes.encrypt(data, key)
+    
+    def decrypt(self, encrypted_data, private_key_bytes):
+        """Decrypt data produced by encrypt() (raises InvalidTag if it was tampered with)"""
+        private_key = X25519PrivateKey.from_private_bytes(bytes(private_key_bytes))
+        public_bytes = private_key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+        ephemeral_public = bytes(encrypted_data[:self.key_size])
+        shared_secret = private_key.exchange(X25519PublicKey.from_public_bytes(ephemeral_public))
+        key = self._derive_key(shared_secret, ephemeral_public, public_bytes)
+        return self.aes.decrypt(encrypted_data[self.key_size:], key)
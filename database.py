@@ -4,405 +4,783 @@ Database management for CNS project
 SQLite database for storing encrypted files and transaction data
 """
 
+import atexit
+import logging
+import os
+import queue
+import shutil
 import sqlite3
+import stat
+import tempfile
 import threading
-from datetime import datetime
+import time
+from contextlib import contextmanager
+from io import BytesIO
+from itertools import islice
+
+logger = logging.getLogger(__name__)
+
+# Original tables; columns added since are listed in _ADDED_COLUMNS
+_DDL_TABLES = '''
+    -- Sessions table for E2E encrypted transfers
+    CREATE TABLE IF NOT EXISTS sessions (
+        session_id TEXT PRIMARY KEY,
+        sender_id TEXT NOT NULL,
+        server_url TEXT NOT NULL,
+        public_key_p TEXT,
+        public_key_g TEXT,
+        public_key_y TEXT,
+        encrypted_file BLOB,
+        encrypted_aes_key BLOB,
+        hash_value TEXT,
+        file_name TEXT,
+        huffman_tree BLOB,
+        original_size INTEGER DEFAULT 0,
+        compressed_size INTEGER DEFAULT 0,
+        compression_ratio REAL DEFAULT 0.0,
+        status TEXT DEFAULT 'WAITING_FOR_RECEIVER',
+        attempt_count INTEGER DEFAULT 0,
+        expiry_time TEXT NOT NULL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+        receiver_joined_at TEXT,
+        key_generated_at TEXT,
+        file_uploaded_at TEXT,
+        accessed_at TEXT
+    );
+    
+    -- Transactions table (original schema - kept for compatibility)
+    CREATE TABLE IF NOT EXISTS transactions (
+        transaction_id TEXT PRIMARY KEY,
+        encrypted_file BLOB NOT NULL,
+        encrypted_aes_key BLOB NOT NULL,
+        private_key BLOB NOT NULL,
+        hash_value TEXT DEFAULT '',
+        hashed_pin BLOB NOT NULL,
+        attempt_count INTEGER DEFAULT 0,
+        expiry_time TEXT NOT NULL,
+        status TEXT DEFAULT 'ACTIVE',
+        file_name TEXT NOT NULL,
+        huffman_tree BLOB NOT NULL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+    
+    -- Temporary files table for downloads
+    CREATE TABLE IF NOT EXISTS temp_files (
+        transaction_id TEXT PRIMARY KEY,
+        file_data BLOB NOT NULL,
+        file_name TEXT NOT NULL,
+        created_at TEXT DEFAULT CURRENT_TIMESTAMP
+    );
+'''
+
+# Columns added to existing tables (ALTER TABLE ADD COLUMN isn't idempotent, so each is probed first)
+_ADDED_COLUMNS = {
+    'transactions': [
+        ('original_size', 'INTEGER DEFAULT 0'),
+        ('compressed_size', 'INTEGER DEFAULT 0'),
+        ('compression_ratio', 'REAL DEFAULT 0.0'),
+        ('receiver_name', 'TEXT DEFAULT ""'),
+        ('accessed_at', 'TEXT DEFAULT ""'),
+        ('intended_receiver_name', 'TEXT DEFAULT ""'),
+        ('expiry_epoch', 'INTEGER DEFAULT 0'),
+    ],
+    'temp_files': [
+        ('file_path', 'TEXT DEFAULT ""'),
+        ('created_epoch', 'INTEGER DEFAULT 0'),
+    ],
+    'sessions': [
+        ('expiry_epoch', 'INTEGER DEFAULT 0'),
+    ],
+}
+
+_DDL_MIGRATE = '''
+    -- Backfill the unix-second columns for rows stored before they existed, so the cleanup
+    -- jobs are integer range scans; expiry_time is naive local time, which the 'utc' modifier
+    -- converts from, while created_at is CURRENT_TIMESTAMP and already UTC
+    UPDATE transactions
+    SET expiry_epoch = CAST(strftime('%s', expiry_time, 'utc') AS INTEGER)
+    WHERE expiry_epoch = 0;
+    UPDATE temp_files
+    SET created_epoch = CAST(strftime('%s', created_at) AS INTEGER)
+    WHERE created_epoch = 0;
+    UPDATE sessions
+    SET expiry_epoch = CAST(strftime('%s', expiry_time, 'utc') AS INTEGER)
+    WHERE expiry_epoch = 0;
+    
+    -- Indexes for the cleanup and stats queries, which would otherwise scan whole tables
+    CREATE INDEX IF NOT EXISTS idx_tx_expiry ON transactions(expiry_epoch);
+    CREATE INDEX IF NOT EXISTS idx_tx_status ON transactions(status) WHERE status = 'ACTIVE';
+    CREATE INDEX IF NOT EXISTS idx_sessions_expiry ON sessions(expiry_epoch);
+    CREATE INDEX IF NOT EXISTS idx_tmp_created ON temp_files(created_epoch);
+'''
+
+# Hot-path statements are kept as constants so every call passes the same SQL text
+# and hits the connection's prepared-statement cache.
+# hash_value is written as '' because older databases declare it NOT NULL;
+# integrity is now provided by the AES-GCM tag inside encrypted_file
+_SQL_INSERT_TX_FULL = '''
+    INSERT INTO transactions 
+    (transaction_id, encrypted_file, encrypted_aes_key, private_key, 
+     hash_value, hashed_pin, expiry_time, file_name, huffman_tree,
+     original_size, compressed_size, compression_ratio, intended_receiver_name,
+     expiry_epoch)
+    VALUES (?, ?, ?, ?, '', ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+_SQL_INSERT_TX_RECEIVER = '''
+    INSERT INTO transactions 
+    (transaction_id, encrypted_file, encrypted_aes_key, private_key, 
+     hash_value, hashed_pin, expiry_time, file_name, huffman_tree,
+     original_size, compressed_size, compression_ratio, intended_receiver_name)
+    VALUES (?, ?, ?, ?, '', ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+_SQL_INSERT_TX_COMPRESSION = '''
+    INSERT INTO transactions 
+    (transaction_id, encrypted_file, encrypted_aes_key, private_key, 
+     hash_value, hashed_pin, expiry_time, file_name, huffman_tree,
+     original_size, compressed_size, compression_ratio)
+    VALUES (?, ?, ?, ?, '', ?, ?, ?, ?, ?, ?, ?)
+'''
+_SQL_INSERT_TX_LEGACY = '''
+    INSERT INTO transactions 
+    (transaction_id, encrypted_file, encrypted_aes_key, private_key, 
+     hash_value, hashed_pin, expiry_time, file_name, huffman_tree)
+    VALUES (?, ?, ?, ?, '', ?, ?, ?, ?)
+'''
+_SQL_SELECT_TX = 'SELECT * FROM transactions WHERE transaction_id = ?'
+# Everything except the encrypted payload, keys and Huffman table
+_SQL_SELECT_TX_META = '''
+    SELECT transaction_id, hashed_pin, attempt_count, expiry_time, expiry_epoch, status,
+           file_name, intended_receiver_name, receiver_name, accessed_at AS access_time, created_at
+    FROM transactions WHERE transaction_id = ?
+'''
+# Local-time ISO-8601 stamp (the format datetime.now().isoformat() wrote), taken by SQLite
+# so status updates don't build a datetime in Python
+_SQL_NOW = "strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')"
+# One UPDATE for both a failed attempt and a successful access; NULL leaves a column unchanged
+_SQL_RECORD_ACCESS_FULL = f'''
+    UPDATE transactions 
+    SET status = COALESCE(?1, status), receiver_name = COALESCE(?2, receiver_name),
+        accessed_at = CASE WHEN ?1 IS NULL THEN accessed_at ELSE {_SQL_NOW} END,
+        attempt_count = attempt_count + ?3
+    WHERE transaction_id = ?4
+    RETURNING attempt_count
+'''
+_SQL_RECORD_ACCESS_LEGACY = '''
+    UPDATE transactions 
+    SET status = COALESCE(?, status), attempt_count = attempt_count + ?
+    WHERE transaction_id = ?
+    RETURNING attempt_count
+'''
+# Counts the attempt before anything is checked, so concurrent guesses can't all pass the limit
+_SQL_CLAIM_ATTEMPT = '''
+    UPDATE transactions 
+    SET attempt_count = attempt_count + 1
+    WHERE transaction_id = ?
+    RETURNING attempt_count, hashed_pin, expiry_epoch, intended_receiver_name
+'''
+_SQL_DELETE_TX = 'DELETE FROM transactions WHERE transaction_id = ?'
+_SQL_SELECT_TX_FILE_NAME = 'SELECT file_name FROM transactions WHERE transaction_id = ?'
+# A missing file name falls back to the transaction's, resolved in the same statement
+_SQL_INSERT_TEMP = '''
+    INSERT OR REPLACE INTO temp_files (transaction_id, file_data, file_name, file_path, created_epoch)
+    SELECT ?1, ?2, COALESCE(NULLIF(?3, ''),
+                            (SELECT file_name FROM transactions WHERE transaction_id = ?1),
+                            'download.pdf'), ?4, ?5
+'''
+_SQL_SELECT_TEMP = 'SELECT file_data, file_name, file_path FROM temp_files WHERE transaction_id = ?'
+_SQL_DELETE_TEMP = 'DELETE FROM temp_files WHERE transaction_id = ? RETURNING file_path'
+_SQL_DELETE_TEMP_ROW = 'DELETE FROM temp_files WHERE transaction_id = ?'
+_SQL_CLEANUP_EXPIRED = 'DELETE FROM transactions WHERE expiry_epoch < ?'
+_SQL_CLEANUP_TEMP = 'DELETE FROM temp_files WHERE created_epoch < ? RETURNING file_path'
+_SQL_STATS_ACTIVE = "SELECT COUNT(*) FROM transactions WHERE status = 'ACTIVE'"
+_SQL_STATS_SESSIONS = "SELECT COUNT(*) FROM sessions WHERE status != 'ACCESSED'"
+_SQL_STATS_TEMP = 'SELECT COUNT(*) FROM temp_files'
 
 
 class DatabaseManager:
-    def __init__(self, db_path='secure_transfer.db'):
+    # Decrypted downloads larger than this go to the spool directory instead of SQLite
+    TEMP_FILE_SPOOL_THRESHOLD = 1024 * 1024
+    # Idle connections kept open for reuse; extra concurrent requests open (and close) their own
+    POOL_SIZE = 8
+    # Rows committed per write transaction by store_transactions
+    BULK_BATCH_SIZE = 500
+    # Temp-file rows the background writer commits per transaction
+    WRITE_BEHIND_BATCH_SIZE = 100
+    # Extra attempts at BEGIN IMMEDIATE when SQLite reports the database locked past busy_timeout
+    WRITE_RETRIES = 3
+    
+    def __init__(self, db_path='secure_transfer.db', temp_dir=None):
         self.db_path = db_path
-        self.lock = threading.Lock()
+        # Decrypted downloads are spooled here (tmpfs when available) rather than into SQLite.
+        # The default is a fresh owner-only directory per process, so no other local user
+        # can pre-create it or plant files in it; it is removed at exit
+        if temp_dir is None:
+            base_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+            temp_dir = tempfile.mkdtemp(prefix='cns_temp_files_', dir=base_dir)
+            atexit.register(shutil.rmtree, temp_dir, ignore_errors=True)
+        self.temp_dir = temp_dir
+        self._pool = queue.LifoQueue(maxsize=self.POOL_SIZE)
+        # Column names of the transactions table, read once (columns are only added by init_database)
+        self._transaction_columns = None
+        # INSERT builder for that schema, bound once by _bind_insert
+        self._insert_transaction = None
+        # Temp-file rows are committed by a background writer; until then they are served from _pending_temp
+        self._write_queue = queue.Queue()
+        self._pending_temp = {}
+        self._pending_lock = threading.Lock()
+        self._writer = None
+    
+    def _new_conn(self):
+        """Open a connection in autocommit mode with the per-connection settings applied
+        
+        Reads never hold a transaction open; writes go through _write().
+        """
+        # Room for every constant statement above plus the session queries in each connection's cache
+        conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None,
+                               cached_statements=256)
+        conn.row_factory = sqlite3.Row  # Enable dict-like access on every query
+        # Per-connection settings (journal_mode=WAL is persistent, set in init_database)
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA mmap_size=268435456')
+        conn.execute('PRAGMA cache_size=-65536')  # Up to 64 MB of page cache, allocated as used
+        return conn
+    
+    @contextmanager
+    def _conn(self):
+        """Borrow a pooled connection for the block, opening one if none is idle
+        
+        The development server runs each request on a fresh thread, so connections
+        are pooled rather than kept per thread. A connection whose block raised is
+        closed instead of being returned.
+        """
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._new_conn()
+        try:
+            yield conn
+        except BaseException:
+            conn.close()
+            raise
+        try:
+            self._pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+    
+    @contextmanager
+    def _write(self):
+        """Run the block as one write transaction on a pooled connection
+        
+        BEGIN IMMEDIATE takes the write lock up front, so a second writer waits
+        (busy_timeout) instead of failing when it tries to upgrade a read lock.
+        SQLite's single-writer lock is the only write serialization; if it is still
+        busy after the timeout, BEGIN is retried a few times with a short backoff.
+        """
+        with self._conn() as conn:
+            for attempt in range(self.WRITE_RETRIES + 1):
+                try:
+                    conn.execute('BEGIN IMMEDIATE')
+                    break
+                except sqlite3.OperationalError as e:
+                    if 'locked' not in str(e) or attempt == self.WRITE_RETRIES:
+                        raise
+                    time.sleep(0.05 * 2 ** attempt)
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
     
     def init_database(self):
         """Initialize SQLite database with required tables"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Create sessions table for E2E encrypted transfers
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS sessions (
-                    session_id TEXT PRIMARY KEY,
-                    sender_id TEXT NOT NULL,
-                    server_url TEXT NOT NULL,
-                    public_key_p TEXT,
-                    public_key_g TEXT,
-                    public_key_y TEXT,
-                    encrypted_file TEXT,
-                    encrypted_aes_key TEXT,
-                    hash_value TEXT,
-                    file_name TEXT,
-                    huffman_tree TEXT,
-                    original_size INTEGER DEFAULT 0,
-                    compressed_size INTEGER DEFAULT 0,
-                    compression_ratio REAL DEFAULT 0.0,
-                    status TEXT DEFAULT 'WAITING_FOR_RECEIVER',
-                    attempt_count INTEGER DEFAULT 0,
-                    expiry_time TEXT NOT NULL,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP,
-                    receiver_joined_at TEXT,
-                    key_generated_at TEXT,
-                    file_uploaded_at TEXT,
-                    accessed_at TEXT
-                )
-            ''')
-            
-            # Create transactions table (original schema - kept for compatibility)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS transactions (
-                    transaction_id TEXT PRIMARY KEY,
-                    encrypted_file TEXT NOT NULL,
-                    encrypted_aes_key TEXT NOT NULL,
-                    private_key TEXT NOT NULL,
-                    hash_value TEXT NOT NULL,
-                    hashed_pin TEXT NOT NULL,
-                    attempt_count INTEGER DEFAULT 0,
-                    expiry_time TEXT NOT NULL,
-                    status TEXT DEFAULT 'ACTIVE',
-                    file_name TEXT NOT NULL,
-                    huffman_tree TEXT NOT NULL,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Extend schema with new columns if they don't exist
-            self._add_column_if_not_exists(cursor, 'transactions', 'original_size', 'INTEGER DEFAULT 0')
-            self._add_column_if_not_exists(cursor, 'transactions', 'compressed_size', 'INTEGER DEFAULT 0')
-            self._add_column_if_not_exists(cursor, 'transactions', 'compression_ratio', 'REAL DEFAULT 0.0')
-            self._add_column_if_not_exists(cursor, 'transactions', 'receiver_name', 'TEXT DEFAULT ""')
-            self._add_column_if_not_exists(cursor, 'transactions', 'accessed_at', 'TEXT DEFAULT ""')
-            self._add_column_if_not_exists(cursor, 'transactions', 'intended_receiver_name', 'TEXT DEFAULT ""')
-            
-            # Create temporary files table for downloads
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS temp_files (
-                    transaction_id TEXT PRIMARY KEY,
-                    file_data BLOB NOT NULL,
-                    file_name TEXT NOT NULL,
-                    created_at TEXT DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
-            print("Database initialized successfully")
+        with self._conn() as conn:
+            # WAL lets readers run alongside the writer and needs fewer fsyncs per commit
+            # (it can't be switched inside a transaction)
+            conn.execute('PRAGMA journal_mode=WAL')
+            
+            # Probe each table once; a table that doesn't exist yet reports no columns,
+            # and CREATE TABLE only has the original ones, so all of its additions apply
+            script = ['BEGIN IMMEDIATE;', _DDL_TABLES]
+            for table_name, added_columns in _ADDED_COLUMNS.items():
+                columns = {row[1] for row in conn.execute(f"PRAGMA table_info({table_name})")}
+                for column_name, column_definition in added_columns:
+                    if column_name not in columns:
+                        script.append(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_definition};")
+                        print(f"Added column {column_name} to {table_name} table")
+            script.append(_DDL_MIGRATE)
+            
+            # Gather planner statistics the first time; later startups only refresh stale ones
+            has_stats = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+            script.append('PRAGMA optimize;' if has_stats else 'ANALYZE;')
+            script.append('COMMIT;')
+            
+            # One script, one transaction: a failure leaves the schema untouched
+            conn.executescript('\n'.join(script))
+            
+            self._transaction_columns = None
+            self._bind_insert(self._get_transaction_columns(conn.cursor()))
+        
+        self._spool_dir()
+        
+        print("Database initialized successfully")
     
-    def _add_column_if_not_exists(self, cursor, table_name, column_name, column_definition):
-        """Add column to table if it doesn't already exist"""
-        try:
-            # Check if column exists by getting table info
-            cursor.execute(f"PRAGMA table_info({table_name})")
-            columns = [row[1] for row in cursor.fetchall()]
-            
-            if column_name not in columns:
-                # Column doesn't exist, add it
-                cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_definition}")
-                print(f"Added column {column_name} to {table_name} table")
-            else:
-                print(f"Column {column_name} already exists in {table_name} table")
-                
-        except Exception as e:
-            print(f"Error adding column {column_name} to {table_name}: {str(e)}")
-            # Don't raise exception to avoid breaking initialization
+    def _get_transaction_columns(self, cursor):
+        """Return the transactions table's column names, probing the schema only on first use"""
+        if self._transaction_columns is None:
+            cursor.execute("PRAGMA table_info(transactions)")
+            self._transaction_columns = frozenset(row[1] for row in cursor.fetchall())
+        return self._transaction_columns
+    
+    def _bind_insert(self, columns):
+        """Pick the INSERT builder matching the schema (given its column names) once, rather than per row"""
+        if not all(col in columns for col in ['original_size', 'compressed_size', 'compression_ratio']):
+            # Use original schema (backward compatibility)
+            self._insert_transaction = self._insert_legacy
+        elif 'intended_receiver_name' not in columns:
+            # Use compression columns only
+            self._insert_transaction = self._insert_compression
+        elif 'expiry_epoch' not in columns:
+            # Use extended schema without expiry_epoch
+            self._insert_transaction = self._insert_receiver
+        else:
+            # Use fully extended schema with all new columns
+            self._insert_transaction = self._insert_full
+    
+    def _insert_legacy(self, transaction_id, encrypted_file, encrypted_aes_key, private_key,
+                       hashed_pin, expiry_time, file_name, huffman_tree, original_size=None,
+                       compressed_size=None, compression_ratio=None, intended_receiver_name=None):
+        """Return the original-schema INSERT and its parameters"""
+        base = (transaction_id, encrypted_file, encrypted_aes_key, private_key,
+                hashed_pin, expiry_time.isoformat(), file_name, huffman_tree)
+        return _SQL_INSERT_TX_LEGACY, base
+    
+    def _insert_compression(self, transaction_id, encrypted_file, encrypted_aes_key, private_key,
+                            hashed_pin, expiry_time, file_name, huffman_tree, original_size=None,
+                            compressed_size=None, compression_ratio=None, intended_receiver_name=None):
+        """Return the INSERT with compression columns and its parameters"""
+        base = (transaction_id, encrypted_file, encrypted_aes_key, private_key,
+                hashed_pin, expiry_time.isoformat(), file_name, huffman_tree)
+        return _SQL_INSERT_TX_COMPRESSION, base + (original_size or 0, compressed_size or 0, compression_ratio or 0.0)
+    
+    def _insert_receiver(self, transaction_id, encrypted_file, encrypted_aes_key, private_key,
+                         hashed_pin, expiry_time, file_name, huffman_tree, original_size=None,
+                         compressed_size=None, compression_ratio=None, intended_receiver_name=None):
+        """Return the INSERT without expiry_epoch and its parameters"""
+        base = (transaction_id, encrypted_file, encrypted_aes_key, private_key,
+                hashed_pin, expiry_time.isoformat(), file_name, huffman_tree)
+        return _SQL_INSERT_TX_RECEIVER, base + (original_size or 0, compressed_size or 0, compression_ratio or 0.0,
+                                                intended_receiver_name or '')
+    
+    def _insert_full(self, transaction_id, encrypted_file, encrypted_aes_key, private_key,
+                     hashed_pin, expiry_time, file_name, huffman_tree, original_size=None,
+                     compressed_size=None, compression_ratio=None, intended_receiver_name=None):
+        """Return the fully extended INSERT and its parameters"""
+        base = (transaction_id, encrypted_file, encrypted_aes_key, private_key,
+                hashed_pin, expiry_time.isoformat(), file_name, huffman_tree)
+        return _SQL_INSERT_TX_FULL, base + (original_size or 0, compressed_size or 0, compression_ratio or 0.0,
+                                            intended_receiver_name or '', int(expiry_time.timestamp()))
     
     def store_transaction(self, transaction_id, encrypted_file, encrypted_aes_key, 
-                         private_key, hash_value, hashed_pin, expiry_time, 
+                         private_key, hashed_pin, expiry_time, 
                          file_name, huffman_tree, original_size=None, compressed_size=None, 
                          compression_ratio=None, intended_receiver_name=None):
         """Store transaction data in database"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Check if new columns exist before trying to use them
-            cursor.execute("PRAGMA table_info(transactions)")
-            columns = [row[1] for row in cursor.fetchall()]
-            
-            has_compression_columns = all(col in columns for col in ['original_size', 'compressed_size', 'compression_ratio'])
-            has_intended_receiver = 'intended_receiver_name' in columns
-            
-            if has_compression_columns and original_size is not None:
-                if has_intended_receiver:
-                    # Use fully extended schema with all new columns
-                    cursor.execute('''
-                        INSERT INTO transactions 
-                        (transaction_id, encrypted_file, encrypted_aes_key, private_key, 
-                         hash_value, hashed_pin, expiry_time, file_name, huffman_tree,
-                         original_size, compressed_size, compression_ratio, intended_receiver_name)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (transaction_id, encrypted_file, encrypted_aes_key, private_key,
-                          hash_value, hashed_pin, expiry_time.isoformat(), file_name, huffman_tree,
-                          original_size or 0, compressed_size or 0, compression_ratio or 0.0,
-                          intended_receiver_name or ''))
-                else:
-                    # Use compression columns only
-                    cursor.execute('''
-                        INSERT INTO transactions 
-                        (transaction_id, encrypted_file, encrypted_aes_key, private_key, 
-                         hash_value, hashed_pin, expiry_time, file_name, huffman_tree,
-                         original_size, compressed_size, compression_ratio)
-                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', (transaction_id, encrypted_file, encrypted_aes_key, private_key,
-                          hash_value, hashed_pin, expiry_time.isoformat(), file_name, huffman_tree,
-                          original_size or 0, compressed_size or 0, compression_ratio or 0.0))
-            else:
-                # Use original schema (backward compatibility)
-                cursor.execute('''
-                    INSERT INTO transactions 
-                    (transaction_id, encrypted_file, encrypted_aes_key, private_key, 
-                     hash_value, hashed_pin, expiry_time, file_name, huffman_tree)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (transaction_id, encrypted_file, encrypted_aes_key, private_key,
-                      hash_value, hashed_pin, expiry_time.isoformat(), file_name, huffman_tree))
-            
-            conn.commit()
-            conn.close()
+        self.store_transactions([{
+            'transaction_id': transaction_id,
+            'encrypted_file': encrypted_file,
+            'encrypted_aes_key': encrypted_aes_key,
+            'private_key': private_key,
+            'hashed_pin': hashed_pin,
+            'expiry_time': expiry_time,
+            'file_name': file_name,
+            'huffman_tree': huffman_tree,
+            'original_size': original_size,
+            'compressed_size': compressed_size,
+            'compression_ratio': compression_ratio,
+            'intended_receiver_name': intended_receiver_name
+        }])
+    
+    def store_transactions(self, rows):
+        """Store several transactions, committing BULK_BATCH_SIZE rows per write transaction
+        
+        Each row is a dict of store_transaction's keyword arguments; every row of a batch
+        uses the same INSERT, so the batch is sent in a single executemany() call.
+        """
+        rows = iter(rows)
+        while True:
+            batch = list(islice(rows, self.BULK_BATCH_SIZE))
+            if not batch:
+                return
+            
+            with self._write() as conn:
+                cursor = conn.cursor()
+                
+                # Bound by init_database; processes that skip it probe the schema here once
+                if self._insert_transaction is None:
+                    self._bind_insert(self._get_transaction_columns(cursor))
+                
+                inserts = [self._insert_transaction(**row) for row in batch]
+                cursor.executemany(inserts[0][0], [params for _, params in inserts])
     
     def get_transaction(self, transaction_id):
-        """Retrieve transaction data from database"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row  # Enable dict-like access
+        """Retrieve transaction data"""
+        with self._conn() as conn:
             cursor = conn.cursor()
             
-            cursor.execute('''
-                SELECT * FROM transactions WHERE transaction_id = ?
-            ''', (transaction_id,))
+            cursor.execute(_SQL_SELECT_TX, (transaction_id,))
             
             result = cursor.fetchone()
-            conn.close()
             
             return dict(result) if result else None
     
-    def increment_attempts(self, transaction_id):
-        """Increment attempt count for a transaction"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                UPDATE transactions 
-                SET attempt_count = attempt_count + 1 
-                WHERE transaction_id = ?
-            ''', (transaction_id,))
-            
-            conn.commit()
-            conn.close()
-    
-    def update_transaction_status(self, transaction_id, status, receiver_name=None, user_agent=None):
-        """Update transaction status and access information"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
+    def record_access(self, transaction_id, status=None, receiver_name=None, increment=True):
+        """Record an access attempt in a single UPDATE and return the new attempt count (None if missing)
+        
+        With a status, the status, receiver name and access time are updated too;
+        increment is added to the attempt count (-1 hands back an attempt taken by claim_attempt).
+        """
+        with self._write() as conn:
             cursor = conn.cursor()
             
-            from datetime import datetime
-            access_time = datetime.now().isoformat()
-            
             # Check if new columns exist before trying to use them
-            cursor.execute("PRAGMA table_info(transactions)")
-            columns = [row[1] for row in cursor.fetchall()]
+            columns = self._get_transaction_columns(cursor)
             
             if 'receiver_name' in columns and 'accessed_at' in columns:
                 # Use new schema
-                cursor.execute('''
-                    UPDATE transactions 
-                    SET status = ?, receiver_name = ?, accessed_at = ?
-                    WHERE transaction_id = ?
-                ''', (status, receiver_name or '', access_time, transaction_id))
+                if status is not None:
+                    receiver_name = receiver_name or ''
+                cursor.execute(_SQL_RECORD_ACCESS_FULL,
+                               (status, receiver_name, int(increment), transaction_id))
             else:
                 # Use original schema (backward compatibility)
-                cursor.execute('''
-                    UPDATE transactions 
-                    SET status = ?
-                    WHERE transaction_id = ?
-                ''', (status, transaction_id))
+                cursor.execute(_SQL_RECORD_ACCESS_LEGACY, (status, int(increment), transaction_id))
             
-            conn.commit()
-            conn.close()
+            result = cursor.fetchone()
+        
+        return result[0] if result else None
     
-    def delete_transaction(self, transaction_id):
-        """Delete transaction from database"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
+    def claim_attempt(self, transaction_id):
+        """Count an access attempt and return the new count with the columns needed to check it
+        
+        The increment and the read are one statement, so every concurrent attempt sees
+        its own count. Returns None if the transaction doesn't exist.
+        """
+        with self._write() as conn:
             cursor = conn.cursor()
             
-            cursor.execute('DELETE FROM transactions WHERE transaction_id = ?', (transaction_id,))
-            
-            conn.commit()
-            conn.close()
+            cursor.execute(_SQL_CLAIM_ATTEMPT, (transaction_id,))
+            result = cursor.fetchone()
+        
+        return dict(result) if result else None
     
-    def store_temp_file(self, transaction_id, file_data, file_name=None):
-        """Store temporary file data for download"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
+    def get_transaction_meta(self, transaction_id):
+        """Retrieve a transaction's small columns (status, PIN hash, attempts, expiry, names)
+        
+        For checks that run before (or instead of) decryption, so the BLOBs are never copied out.
+        """
+        with self._conn() as conn:
             cursor = conn.cursor()
             
-            # Get file name from transaction if not provided
-            if not file_name:
-                cursor.execute('SELECT file_name FROM transactions WHERE transaction_id = ?', (transaction_id,))
-                result = cursor.fetchone()
-                file_name = result[0] if result else 'download.pdf'
+            cursor.execute(_SQL_SELECT_TX_META, (transaction_id,))
+            result = cursor.fetchone()
             
-            cursor.execute('''
-                INSERT OR REPLACE INTO temp_files (transaction_id, file_data, file_name)
-                VALUES (?, ?, ?)
-            ''', (transaction_id, file_data, file_name))
+            return dict(result) if result else None
+    
+    def increment_attempts(self, transaction_id):
+        """Increment attempt count for a transaction and return the new count (None if missing)"""
+        return self.record_access(transaction_id)
+    
+    def update_transaction_status(self, transaction_id, status, receiver_name=None, user_agent=None):
+        """Update transaction status and access information"""
+        self.record_access(transaction_id, status, receiver_name, increment=False)
+    
+    def delete_transaction(self, transaction_id):
+        """Delete transaction from database"""
+        with self._write() as conn:
+            cursor = conn.cursor()
             
-            conn.commit()
-            conn.close()
+            cursor.execute(_SQL_DELETE_TX, (transaction_id,))
+    
+    def _spool_dir(self):
+        """Create the spool directory if needed and return it, refusing one another user could write to"""
+        os.makedirs(self.temp_dir, mode=0o700, exist_ok=True)
+        st = os.lstat(self.temp_dir)
+        if (not stat.S_ISDIR(st.st_mode) or st.st_mode & 0o077
+                or (hasattr(os, 'geteuid') and st.st_uid != os.geteuid())):
+            raise PermissionError(f"Spool directory {self.temp_dir} must be a directory owned by this user with mode 0700")
+        return self.temp_dir
+    
+    def _write_spool_file(self, transaction_id, file_data):
+        """Write decrypted file data to the spool directory (owner-only) and return its path"""
+        file_path = os.path.join(self._spool_dir(), f'{transaction_id}.bin')
+        # A previous download of the same transaction may have left its file; O_EXCL and
+        # O_NOFOLLOW then guarantee the file written is a new one, never a planted link
+        self._remove_spool_file(file_path)
+        flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_NOFOLLOW', 0) | getattr(os, 'O_BINARY', 0)
+        fd = os.open(file_path, flags, 0o600)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(file_data)
+        return file_path
+    
+    def _remove_spool_file(self, file_path):
+        """Remove a spooled file, ignoring files that are already gone"""
+        if not file_path:
+            return
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error removing temp file {file_path}: {str(e)}")
+    
+    def store_temp_file(self, transaction_id, file_data, file_name=None):
+        """Stage temporary file data for download (large files are spooled to disk)
+        
+        The row is committed by the background writer, so the request doesn't wait
+        on the commit; get_temp_file sees it immediately. Temp files are disposable,
+        so losing an uncommitted row in a crash is acceptable.
+        """
+        # Small files stay inline, which saves a file create/unlink per download
+        if len(file_data) > self.TEMP_FILE_SPOOL_THRESHOLD:
+            file_path = self._write_spool_file(transaction_id, file_data)
+            file_data = b''
+        else:
+            file_path = ''
+        
+        row = (transaction_id, bytes(file_data), file_name, file_path, int(time.time()))
+        with self._pending_lock:
+            self._pending_temp[transaction_id] = row
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._writer_loop, name='temp-file-writer', daemon=True)
+                self._writer.start()
+                atexit.register(self.flush)
+        self._write_queue.put((row, 0))
+    
+    def _writer_loop(self):
+        """Commit staged temp-file rows in batches (runs on the background writer thread)
+        
+        Queue entries are (row, failed commits). _pending_lock is held only to pick rows
+        and to retire them, never across the commit, so requests don't wait on SQLite.
+        """
+        while True:
+            batch = [self._write_queue.get()]
+            try:
+                # Gather whatever else arrives within 50ms into the same commit
+                while len(batch) < self.WRITE_BEHIND_BATCH_SIZE:
+                    batch.append(self._write_queue.get(timeout=0.05))
+            except queue.Empty:
+                pass
+            
+            try:
+                # Rows replaced or deleted since they were queued are skipped
+                with self._pending_lock:
+                    entries = [(row, failures) for row, failures in batch
+                               if self._pending_temp.get(row[0]) is row]
+                if not entries:
+                    continue
+                
+                rows = [row for row, _ in entries]
+                try:
+                    with self._write() as conn:
+                        conn.executemany(_SQL_INSERT_TEMP, rows)
+                except sqlite3.Error:
+                    logger.exception("Error writing %d temp file(s)", len(rows))
+                    self._retry_temp_rows(entries)
+                    continue
+                
+                with self._pending_lock:
+                    deleted = []
+                    for row in rows:
+                        pending = self._pending_temp.get(row[0])
+                        if pending is row:
+                            del self._pending_temp[row[0]]
+                        elif pending is None:
+                            deleted.append((row[0],))
+                if deleted:
+                    # delete_temp_file ran while these were being committed; its DELETE may have
+                    # gone first, so drop the rows again (their spool files are already gone)
+                    with self._write() as conn:
+                        conn.executemany(_SQL_DELETE_TEMP_ROW, deleted)
+            except sqlite3.Error:
+                logger.exception("Error removing deleted temp files")
+            finally:
+                for _ in batch:
+                    self._write_queue.task_done()
+    
+    def _retry_temp_rows(self, entries):
+        """Queue rows whose commit failed again, giving up on those that failed WRITE_RETRIES times"""
+        time.sleep(0.05)
+        for row, failures in entries:
+            if failures < self.WRITE_RETRIES:
+                self._write_queue.put((row, failures + 1))
+                continue
+            
+            logger.error("Giving up on temp file for %s after %d failed commits", row[0], failures + 1)
+            with self._pending_lock:
+                abandoned = self._pending_temp.get(row[0]) is row
+                if abandoned:
+                    del self._pending_temp[row[0]]
+            if abandoned:
+                self._remove_spool_file(row[3])
+    
+    def flush(self):
+        """Block until every staged temp-file row has been committed (or given up on)"""
+        if self._writer is not None:
+            self._write_queue.join()
+    
+    def _open_temp_file(self, file_data, file_name, file_path):
+        """Return the get_temp_file result for a stored (or staged) row"""
+        if file_path:
+            try:
+                file = open(file_path, 'rb')
+            except FileNotFoundError:
+                return None
+        else:
+            file = BytesIO(file_data)
+        
+        return {
+            'file': file,
+            'name': file_name
+        }
     
     def get_temp_file(self, transaction_id):
-        """Retrieve temporary file data"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
+        """Retrieve temporary file as an open binary file object
+        
+        Small files (and rows written before spooling existed) carry their data inline.
+        """
+        with self._pending_lock:
+            row = self._pending_temp.get(transaction_id)
+        if row is not None:
+            _, file_data, file_name, file_path, _ = row
+            if not file_name:
+                # Not committed yet, so resolve the default name the INSERT would use
+                with self._conn() as conn:
+                    result = conn.execute(_SQL_SELECT_TX_FILE_NAME, (transaction_id,)).fetchone()
+                file_name = result[0] if result else 'download.pdf'
+            return self._open_temp_file(file_data, file_name, file_path)
+        
+        with self._conn() as conn:
             cursor = conn.cursor()
             
-            cursor.execute('''
-                SELECT file_data, file_name FROM temp_files WHERE transaction_id = ?
-            ''', (transaction_id,))
+            cursor.execute(_SQL_SELECT_TEMP, (transaction_id,))
             
             result = cursor.fetchone()
-            conn.close()
             
-            if result:
-                return {
-                    'data': result['file_data'],
-                    'name': result['file_name']
-                }
-            return None
+            if not result:
+                return None
+            
+            return self._open_temp_file(result['file_data'], result['file_name'], result['file_path'])
     
     def delete_temp_file(self, transaction_id):
-        """Delete temporary file data"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
+        """Delete temporary file data
+        
+        A file already opened by get_temp_file stays readable after this on POSIX.
+        """
+        with self._pending_lock:
+            row = self._pending_temp.pop(transaction_id, None)
+        if row is not None:
+            self._remove_spool_file(row[3])
+        
+        with self._write() as conn:
             cursor = conn.cursor()
             
-            cursor.execute('DELETE FROM temp_files WHERE transaction_id = ?', (transaction_id,))
-            
-            conn.commit()
-            conn.close()
+            cursor.execute(_SQL_DELETE_TEMP, (transaction_id,))
+            result = cursor.fetchone()
+        
+        if result:
+            self._remove_spool_file(result[0])
     
     def cleanup_expired_transactions(self):
         """Clean up expired transactions"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
+        with self._write() as conn:
             cursor = conn.cursor()
             
-            current_time = datetime.now().isoformat()
-            cursor.execute('''
-                DELETE FROM transactions WHERE expiry_time < ?
-            ''', (current_time,))
+            cursor.execute(_SQL_CLEANUP_EXPIRED, (int(time.time()),))
             
             deleted_count = cursor.rowcount
-            conn.commit()
-            conn.close()
-            
-            return deleted_count
+        
+        return deleted_count
     
     def cleanup_old_temp_files(self, hours=1):
         """Clean up old temporary files"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
+        with self._write() as conn:
             cursor = conn.cursor()
             
-            cutoff_time = datetime.now().replace(hour=datetime.now().hour - hours).isoformat()
-            cursor.execute('''
-                DELETE FROM temp_files WHERE created_at < ?
-            ''', (cutoff_time,))
-            
-            deleted_count = cursor.rowcount
-            conn.commit()
-            conn.close()
-            
-            return deleted_count
+            cursor.execute(_SQL_CLEANUP_TEMP, (int(time.time()) - hours * 3600,))
+            file_paths = [row[0] for row in cursor.fetchall()]
+        
+        for file_path in file_paths:
+            self._remove_spool_file(file_path)
+        
+        return len(file_paths)
     
     # Session management methods for E2E encryption
     def create_session(self, session_id, sender_id, server_url, expiry_time):
         """Create a new session for E2E transfer"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
+        with self._write() as conn:
             cursor = conn.cursor()
             
             cursor.execute('''
-                INSERT INTO sessions (session_id, sender_id, server_url, expiry_time)
-                VALUES (?, ?, ?, ?)
-            ''', (session_id, sender_id, server_url, expiry_time.isoformat()))
-            
-            conn.commit()
-            conn.close()
+                INSERT INTO sessions (session_id, sender_id, server_url, expiry_time, expiry_epoch)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (session_id, sender_id, server_url, expiry_time.isoformat(), int(expiry_time.timestamp())))
     
     def get_session(self, session_id):
         """Retrieve session data"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
+        with self._conn() as conn:
             cursor = conn.cursor()
             
             cursor.execute('SELECT * FROM sessions WHERE session_id = ?', (session_id,))
             result = cursor.fetchone()
-            conn.close()
             
             return dict(result) if result else None
     
     def update_session_receiver_joined(self, session_id):
         """Mark session as receiver joined"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
+        with self._write() as conn:
             cursor = conn.cursor()
             
-            cursor.execute('''
+            cursor.execute(f'''
                 UPDATE sessions 
-                SET status = 'RECEIVER_JOINED', receiver_joined_at = ?
+                SET status = 'RECEIVER_JOINED', receiver_joined_at = {_SQL_NOW}
                 WHERE session_id = ?
-            ''', (datetime.now().isoformat(), session_id))
-            
-            conn.commit()
-            conn.close()
+            ''', (session_id,))
     
     def store_session_public_key(self, session_id, public_key_p, public_key_g, public_key_y):
         """Store receiver's public key in session"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
+        with self._write() as conn:
             cursor = conn.cursor()
             
-            cursor.execute('''
+            cursor.execute(f'''
                 UPDATE sessions 
                 SET public_key_p = ?, public_key_g = ?, public_key_y = ?,
-                    status = 'KEY_GENERATED', key_generated_at = ?
+                    status = 'KEY_GENERATED', key_generated_at = {_SQL_NOW}
                 WHERE session_id = ?
-            ''', (public_key_p, public_key_g, public_key_y, datetime.now().isoformat(), session_id))
-            
-            conn.commit()
-            conn.close()
+            ''', (public_key_p, public_key_g, public_key_y, session_id))
     
     def store_session_encrypted_data(self, session_id, encrypted_file, encrypted_aes_key, 
-                                   hash_value, file_name, huffman_tree, original_size, 
+                                   file_name, huffman_tree, original_size, 
                                    compressed_size, compression_ratio):
         """Store encrypted file data in session"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
+        with self._write() as conn:
             cursor = conn.cursor()
             
-            cursor.execute('''
+            cursor.execute(f'''
                 UPDATE sessions 
-                SET encrypted_file = ?, encrypted_aes_key = ?, hash_value = ?,
+                SET encrypted_file = ?, encrypted_aes_key = ?,
                     file_name = ?, huffman_tree = ?, original_size = ?,
                     compressed_size = ?, compression_ratio = ?,
-                    status = 'FILE_UPLOADED', file_uploaded_at = ?
+                    status = 'FILE_UPLOADED', file_uploaded_at = {_SQL_NOW}
                 WHERE session_id = ?
-            ''', (encrypted_file, encrypted_aes_key, hash_value, file_name, huffman_tree,
-                  original_size, compressed_size, compression_ratio, 
-                  datetime.now().isoformat(), session_id))
-            
-            conn.commit()
-            conn.close()
+            ''', (encrypted_file, encrypted_aes_key, file_name, huffman_tree,
+                  original_size, compressed_size, compression_ratio, session_id))
     
     def increment_session_attempts(self, session_id):
         """Increment attempt count for a session"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
+        with self._write() as conn:
             cursor = conn.cursor()
             
             cursor.execute('''
@@ -410,70 +788,53 @@ class DatabaseManager:
                 SET attempt_count = attempt_count + 1 
                 WHERE session_id = ?
             ''', (session_id,))
-            
-            conn.commit()
-            conn.close()
     
     def mark_session_accessed(self, session_id):
         """Mark session as accessed"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
+        with self._write() as conn:
             cursor = conn.cursor()
             
-            cursor.execute('''
+            cursor.execute(f'''
                 UPDATE sessions 
-                SET status = 'ACCESSED', accessed_at = ?
+                SET status = 'ACCESSED', accessed_at = {_SQL_NOW}
                 WHERE session_id = ?
-            ''', (datetime.now().isoformat(), session_id))
-            
-            conn.commit()
-            conn.close()
+            ''', (session_id,))
     
     def delete_session(self, session_id):
         """Delete session from database"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
+        with self._write() as conn:
             cursor = conn.cursor()
             
             cursor.execute('DELETE FROM sessions WHERE session_id = ?', (session_id,))
-            conn.commit()
-            conn.close()
     
     def cleanup_expired_sessions(self):
         """Clean up expired sessions"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
+        with self._write() as conn:
             cursor = conn.cursor()
             
-            current_time = datetime.now().isoformat()
-            cursor.execute('DELETE FROM sessions WHERE expiry_time < ?', (current_time,))
+            cursor.execute('DELETE FROM sessions WHERE expiry_epoch < ?', (int(time.time()),))
             
             deleted_count = cursor.rowcount
-            conn.commit()
-            conn.close()
             
             return deleted_count
-
+    
     def get_stats(self):
         """Get database statistics"""
-        with self.lock:
-            conn = sqlite3.connect(self.db_path)
+        with self._conn() as conn:
             cursor = conn.cursor()
             
             # Count active transactions
-            cursor.execute('SELECT COUNT(*) FROM transactions WHERE status = "ACTIVE"')
+            cursor.execute(_SQL_STATS_ACTIVE)
             active_transactions = cursor.fetchone()[0]
             
             # Count active sessions
-            cursor.execute('SELECT COUNT(*) FROM sessions WHERE status != "ACCESSED"')
+            cursor.execute(_SQL_STATS_SESSIONS)
             active_sessions = cursor.fetchone()[0]
             
             # Count temp files
-            cursor.execute('SELECT COUNT(*) FROM temp_files')
+            cursor.execute(_SQL_STATS_TEMP)
             temp_files = cursor.fetchone()[0]
             
-            conn.close()
-            
             return {
                 'active_transactions': active_transactions,
                 'active_sessions': active_sessions,
@@ -0,0 +1,64 @@
+"""Tests for storing a transaction and decrypting it through /decrypt"""
+
+import hashlib
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+from crypto_utils import HuffmanCompression
+from database import DatabaseManager
+
+
+class DecryptTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = DatabaseManager(os.path.join(self.tmp.name, 'test.db'), os.path.join(self.tmp.name, 'spool'))
+        self.db.init_database()
+        self.original_db = app.db_manager
+        app.db_manager = self.db
+        self.client = app.app.test_client()
+
+    def tearDown(self):
+        app.db_manager = self.original_db
+        self.db.flush()
+        self.tmp.cleanup()
+
+    def store(self, transaction_id, data, **sizes):
+        """Encrypt data the way /upload does and store it under PIN 1234"""
+        huffman = HuffmanCompression()
+        compressed = huffman.compress(data)
+        aes_key = app.aes_crypto.generate_key()
+        public_key, private_key = app.x25519.generate_keypair()
+        self.db.store_transaction(transaction_id, app.aes_crypto.encrypt(compressed, aes_key),
+                                  app.x25519.encrypt(aes_key, public_key), private_key,
+                                  hashlib.sha256(b'1234').digest(), datetime.now() + timedelta(minutes=5),
+                                  'photo.png', huffman.get_tree(), **sizes)
+
+    def decrypt(self, transaction_id, pin='1234'):
+        return self.client.post('/decrypt', json={'transaction_id': transaction_id, 'pin': pin})
+
+    def test_decrypt_without_sizes(self):
+        self.store('no-sizes', b'image bytes' * 100)
+
+        self.assertGreater(self.db.get_transaction_meta('no-sizes')['expiry_epoch'], 0)
+        response = self.decrypt('no-sizes')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['file_type'], 'image')
+
+        self.db.cleanup_expired_transactions()
+        self.assertIsNotNone(self.db.get_transaction_meta('no-sizes'))
+
+    def test_decrypt_with_sizes(self):
+        data = b'image bytes' * 100
+        self.store('sizes', data, original_size=len(data), compressed_size=len(data), compression_ratio=0.0)
+
+        self.assertEqual(self.decrypt('sizes').status_code, 200)
+
+
+if __name__ == '__main__':
+    unittest.main()